@@ -1,12 +1,17 @@
-import time, serial, matplotlib.pyplot as plt, numpy as np, csv, os
-from collections import deque
+from control_core import pid_step  # first: sets the OpenMP thread limits
+import os, sys, time, serial, matplotlib.pyplot as plt, numpy as np, csv
+from threading import Thread, Event
 from matplotlib.widgets import TextBox
-from read_temp import select_roi, read_temperature_from_roi
+from read_temp import select_roi, read_temperature_from_roi, warmup
+from ringbuf import RingBuffer
 from datetime import datetime
 
 INTERVAL  = 0.01   # s
 PORT      = "COM3"
 SETPOINT0 = 70.0   # ºC 
+LIMITS_PERIOD = 1.0  # s, axis-limit updates (full redraws); blit in between
+PRINT_PERIOD = 0.2   # s, console status line (printer thread)
+KEEPALIVE = 0.5      # s, re-send unchanged PWM at least this often
 
 # ---------------- FILTER ------------------
 class OutlierFilter:
@@ -31,12 +36,9 @@ class PID:
 
         e = self.setpoint - pv
         dt = now - self._last_time if self._last_time else 0.0
-        d = (e - self._last_error)/dt if (self._last_time and dt>0) else 0.0
-        self._integral += e*dt
-
-        out = self.Kp*e + self.Ki*self._integral + self.Kd*d
-
-        lo, hi = self.output_limits; out = max(lo, min(hi, out))
+        lo, hi = self.output_limits
+        out, self._integral = pid_step(e, self._integral, self._last_error, dt,
+                                       self.Kp, self.Ki, self.Kd, lo, hi)
 
         self._last_error, self._last_time = e, now
 
@@ -63,8 +65,11 @@ def main():
     csv_file = open(log_path, "w", newline="", encoding="utf-8")
     csv_writer = csv.writer(csv_file)
     csv_writer.writerow(["time_s", "temp_c", "setpoint_c", "pwm", "error_c"])
-    tlog0 = time.time()
-    _last_flush = time.time()
+    tlog0 = time.monotonic()
+    _last_flush = time.monotonic()
+
+    # --- OCR: model load + first inference before the loop ---
+    warmup()
 
     # --- Arduino ---
     ser = serial.Serial(PORT, 9600, timeout=1); time.sleep(2)
@@ -72,9 +77,9 @@ def main():
     plt.ion(); fig, ax = plt.subplots()
     plt.subplots_adjust(bottom=0.18)
 
-    temps, t_axis = deque(maxlen=200), deque(maxlen=200); t0 = time.time()
-    lt, = ax.plot([], [], 'b', label='Temperature')
-    ls, = ax.plot([], [], 'r--', label='SETPOINT')
+    ring = RingBuffer(200); t0 = time.monotonic()
+    lt, = ax.plot([], [], 'b', label='Temperature', animated=True)
+    setp_line = ax.axhline(pid.setpoint, color='r', ls='--', label='SETPOINT')
     ax.set_xlabel("Time (s)"); ax.set_ylabel("°C")
     ax.set_title("PID control"); ax.legend()
 
@@ -90,50 +95,99 @@ def main():
         except ValueError:
             print("\n[WARN] No valid number.")
 
-        if t_axis:
-            ls.set_data(t_axis, [pid.setpoint]*len(t_axis))
-            ymin = min(min(temps), pid.setpoint)-2
-            ymax = max(max(temps), pid.setpoint)+2
+        setp_line.set_ydata([pid.setpoint, pid.setpoint])
+        if ring.n:
+            t_arr, T_arr = ring.view()
+            ymin = min(float(T_arr.min()), pid.setpoint)-2
+            ymax = max(float(T_arr.max()), pid.setpoint)+2
             ax.set_ylim(ymin, ymax)
-            fig.canvas.draw_idle()
+        fig.canvas.draw_idle()
     textbox.on_submit(submit)
 
+    # -------- Blitting: cache static background after each full redraw --------
+    bg = None
+    def on_draw(event):
+        nonlocal bg
+        bg = fig.canvas.copy_from_bbox(ax.bbox)
+        ax.draw_artist(lt)
+    fig.canvas.mpl_connect("draw_event", on_draw)
+    fig.canvas.draw()
+    next_limits = time.monotonic()
+
+    # -------- Console status: loop stores the latest values, a thread prints them --------
+    status_slot = [None]   # (tf, err, pwm) or None when the reading failed
+    stop_evt = Event()
+    def print_worker():
+        last, last_p, pct = (), None, ""
+        while not stop_evt.wait(PRINT_PERIOD):
+            st = status_slot[0]
+            if st == last:
+                continue
+            last = st
+            if st is None:
+                sys.stdout.write("\rT=  --.- °C (??)")
+            else:
+                tf, err, p = st
+                if p != last_p:  # PWM rarely changes: reuse its % text
+                    pct, last_p = f"{p/2.55:3.0f}", p
+                sys.stdout.write(f"\rT={tf:6.2f} °C | e={err:6.2f} °C | PWM={p:3d} ({pct}%)")
+            sys.stdout.flush()
+    pthr = Thread(target=print_worker, name="StatusPrinter", daemon=True); pthr.start()
+
     pwm = 0
+    last_sent, last_send_t = -1, 0.0
+    next_tick = time.monotonic()
     try:
         while plt.fignum_exists(fig.number):
-            t = time.time()-t0
+            now = time.monotonic()
+            t = now-t0
 
             temp = read_temperature_from_roi(x, y, w, h)
 
             if temp is not None:
                 tf = outlier.update(temp)
                 pwm, err = pid.update(tf)
-                ser.write(bytes([pwm]))
-                print(f"\rT={tf:6.2f} °C | e={err:6.2f} °C | PWM={pwm:3d} ({pwm/2.55:3.0f}%)", end="")
-                temps.append(tf); t_axis.append(t)
-                ls.set_data(t_axis, [pid.setpoint]*len(t_axis))
+                if pwm != last_sent or now - last_send_t > KEEPALIVE:
+                    ser.write(bytes([pwm])); last_sent, last_send_t = pwm, now
+                status_slot[0] = (tf, err, pwm)
+                ring.append(t, tf)
                 # log control loop sample (filtered temp)
-                t_el = time.time() - tlog0
+                t_el = now - tlog0
                 csv_writer.writerow([
                     f"{t_el:.4f}", f"{tf:.4f}", f"{pid.setpoint:.2f}", pwm, f"{err:.4f}"
                 ])
-                if time.time() - _last_flush >= 1.0:
-                    csv_file.flush(); _last_flush = time.time()
+                if now - _last_flush >= 1.0:
+                    csv_file.flush(); _last_flush = now
             else:
-                print("\rT=  --.- °C (??)", end="")
+                status_slot[0] = None
 
             
-            if len(t_axis)>1:
-                lt.set_data(t_axis, temps)
-                ax.set_xlim(max(0, t_axis[0]), t_axis[-1]+1)
-                ymin = min(min(temps), pid.setpoint)-2
-                ymax = max(max(temps), pid.setpoint)+2
-                ax.set_ylim(ymin, ymax)
-                fig.canvas.draw(); fig.canvas.flush_events()
-            time.sleep(INTERVAL)
+            if ring.n>1:
+                t_arr, T_arr = ring.view()
+                lt.set_data(t_arr, T_arr)
+                redraw = bg is None
+                if now >= next_limits:
+                    xlim = (max(0.0, float(t_arr[0])), float(t_arr[-1])+1+LIMITS_PERIOD)
+                    ylim = (min(float(T_arr.min()), pid.setpoint)-2,
+                            max(float(T_arr.max()), pid.setpoint)+2)
+                    if xlim != ax.get_xlim() or ylim != ax.get_ylim():
+                        ax.set_xlim(*xlim); ax.set_ylim(*ylim)
+                        redraw = True
+                    next_limits = now + LIMITS_PERIOD
+                if redraw:
+                    fig.canvas.draw()  # on_draw re-caches the background
+                else:
+                    fig.canvas.restore_region(bg)
+                    ax.draw_artist(lt)
+                    fig.canvas.blit(ax.bbox)
+                fig.canvas.flush_events()
+            # fixed cadence on the monotonic clock (skip ahead after overruns)
+            next_tick = max(next_tick + INTERVAL, time.monotonic())
+            time.sleep(max(0.0, next_tick - time.monotonic()))
     except KeyboardInterrupt:
         print("\nInterrumpted.")
     finally:
+        stop_evt.set(); pthr.join(timeout=1.0)
         ser.write(bytes([0])); print("\nPWM = 0%"); ser.close()
         try:
             csv_file.flush(); csv_file.close()
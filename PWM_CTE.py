@@ -1,22 +1,25 @@
 """
 Manual PWM Control with Background Temperature Reading
 
-Reads temperature from a selected ROI using OCR in a background thread,
+Reads temperature from a selected ROI using OCR in a background process,
 while allowing manual PWM control via Arduino. Plots temperature over time
 and logs data to CSV. Threshold crossing is detected and annotated.
 """
 
+import control_core  # first: sets the OpenMP thread limits
+import os
+import sys
 import time
 import serial
 import matplotlib.pyplot as plt
 import numpy as np
-import csv
-import os
-from collections import deque
 from matplotlib.widgets import TextBox
-from threading import Thread, Event
+from threading import Thread, Event, Lock
+from multiprocessing import Process, Queue as MQueue, Event as MEvent
+from queue import SimpleQueue, Empty, Full
 from time import perf_counter
-from read_temp2 import select_roi, read_temperature_from_roi
+from read_temp2 import select_roi, TempReader
+from ringbuf import RingBuffer
 from datetime import datetime
 
 
@@ -28,8 +31,10 @@ THRESHOLD_C  = 300.0   # Temperature threshold to measure time until threshold(
 
 # Background worker pacing
 OCR_PERIOD   = 0.08    # ~12.5 Hz OCR updates
-PLOT_PERIOD  = 0.10    # ~10 Hz plot updates
-PRINT_PERIOD = 0.10    # ~10 Hz console prints
+PLOT_PERIOD  = 0.10    # ~10 Hz plot updates / GUI event pumping
+PRINT_PERIOD = 0.20    # ~5 Hz console status line (printer thread)
+LIMITS_PERIOD = 1.0    # Axis-limit updates (full redraws); blit in between
+KEEPALIVE    = 0.5     # Re-send unchanged PWM at least this often (s)
 
 
 # ---------------- FILTER ----------------
@@ -45,6 +50,61 @@ class OutlierFilter:
         self.prev = v
         return v
 
+    def update_batch(self, arr):
+        """Apply update() to a 1-D array of consecutive samples."""
+        arr = np.asarray(arr, dtype=np.float64)
+        if arr.size == 0:
+            return arr
+        prev = arr[0] if self.prev is None else self.prev
+        jumps = np.abs(np.diff(arr, prepend=prev)) > self.max_delta
+        if not jumps.any():  # common case: one vectorized pass
+            self.prev = float(arr[-1])
+            return arr
+        # A rejected sample changes the reference for the ones after it,
+        # so only the tail from the first jump needs the sequential rule.
+        k = int(np.argmax(jumps))
+        out = arr.copy()
+        if k > 0:
+            self.prev = float(arr[k - 1])
+        for i in range(k, arr.size):
+            out[i] = self.update(float(arr[i]))
+        return out
+
+
+# ---------------- OCR PROCESS ----------------
+def pin_to_core(core):
+    """Pin the calling process to one CPU (Linux only; no-op elsewhere)."""
+    if hasattr(os, "sched_setaffinity") and (os.cpu_count() or 1) > 1:
+        try:
+            os.sched_setaffinity(0, {core})
+        except OSError:
+            pass
+
+
+def ocr_proc(x, y, w, h, sample_q, stop):
+    """Performs OCR at fixed cadence and pushes (timestamp, T) samples.
+
+    Runs in its own process so capture/OCR work never holds the GIL of
+    the plotting/serial main loop. Samples are dropped if the queue is
+    full (main loop stalled) rather than blocking the capture cadence.
+    """
+    pin_to_core((os.cpu_count() or 1) - 1)  # own core, away from the UI loop
+    ocr = TempReader()  # one capture handle for the whole run
+    try:
+        while not stop.is_set():
+            tstart = perf_counter()
+            tmp = ocr.read(x, y, w, h)
+            if tmp is not None:
+                try:
+                    sample_q.put_nowait((time.monotonic(), tmp))
+                except Full:
+                    pass
+            dt = perf_counter() - tstart
+            stop.wait(max(0.0, OCR_PERIOD - dt))
+    finally:
+        sample_q.cancel_join_thread()  # don't block exit on unread samples
+        ocr.close()
+
 
 def clamp_uint8(v):
     """Clamp value to [0, 255] and return as int."""
@@ -68,11 +128,26 @@ def main():
     log_path = os.path.join(
         logs_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_PWM_CTE.csv"
     )
-    csv_file = open(log_path, "w", newline="", encoding="utf-8")
-    csv_writer = csv.writer(csv_file)
-    csv_writer.writerow(["time_s", "temp_c", "setpoint_c", "pwm", "error_c"])
-    tlog0 = time.time()
-    _last_flush = time.time()
+    # Raw fd: rows are ASCII, so skip the text/buffered layers and hand the
+    # kernel one write per drained batch.
+    csv_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND
+                     | getattr(os, "O_BINARY", 0), 0o644)
+    os.write(csv_fd, b"time_s,temp_c,setpoint_c,pwm,error_c\n")
+    tlog0 = time.monotonic()
+    log_q = SimpleQueue()  # raw (t_el, temp, pwm) rows for the writer thread
+
+    def drain_log():
+        """Format and write every queued row in a single batch."""
+        rows = []
+        while True:
+            try:
+                t_el, tf, p = log_q.get_nowait()
+            except Empty:
+                break
+            rows.append(f"{t_el:.4f},{tf:.4f},,{p},\n")
+        buf = "".join(rows).encode("ascii")
+        while buf:  # os.write may be partial
+            buf = buf[os.write(csv_fd, buf):]
 
     # --- Plot setup ---
     outlier = OutlierFilter(max_delta=70)
@@ -80,9 +155,9 @@ def main():
     fig, ax = plt.subplots()
     plt.subplots_adjust(bottom=0.18)
 
-    temps, t_axis = deque(maxlen=200), deque(maxlen=200)
-    t0 = time.time()
-    lt, = ax.plot([], [], 'b', label='Temperature')
+    ring = RingBuffer(200)
+    t0 = time.monotonic()
+    lt, = ax.plot([], [], 'b', label='Temperature', animated=True)
     ax.set_xlabel("Time (s)")
     ax.set_ylabel("°C")
     ax.set_title("Manual PWM Control")
@@ -90,122 +165,242 @@ def main():
 
     # --- PWM control via TextBox ---
     pwm = clamp_uint8(PWM0)
+    pwm_slot = [pwm]    # latest command for the serial writer
+    pwm_label = f"{pwm:3d} ({pwm / 2.55:3.0f}%)"  # status text, rebuilt only on change
+    pwm_evt = Event()
     axbox = plt.axes([0.30, 0.05, 0.15, 0.07])
     textbox = TextBox(axbox, "PWM (0-100%)", initial=str(pwm))
 
     def submit(text):
-        nonlocal pwm
+        nonlocal pwm, pwm_label
         try:
             pwm = clamp_uint8(float(text))
-            print(f"\nPWM changed to {pwm} ({pwm / 2.55:3.0f}%)")
+            pwm_slot[0] = pwm
+            pwm_evt.set()
+            pwm_pct_str = f"{pwm / 2.55:3.0f}"
+            pwm_label = f"{pwm:3d} ({pwm_pct_str}%)"
+            print(f"\nPWM changed to {pwm} ({pwm_pct_str}%)")
         except ValueError:
             print("\n[WARN] Invalid number.")
 
     textbox.on_submit(submit)
 
+    # --- Blitting: cache the static background after every full redraw ---
+    bg = None
+
+    def on_draw(event):
+        nonlocal bg
+        bg = fig.canvas.copy_from_bbox(ax.bbox)
+        ax.draw_artist(lt)
+
+    fig.canvas.mpl_connect("draw_event", on_draw)
+    fig.canvas.draw()
+
     # --- Threshold crossing detection ---
+    # State machine: on_sample checks the threshold until the first crossing,
+    # then is swapped for a no-op so the test is never evaluated again.
     crossing_time_rel = None
     crossing_time_abs = None
 
-    # --- Background OCR worker ---
-    latest = {"temp": None, "ts": 0.0}
+    def _sample_after_cross(tf, t, now):
+        pass
+
+    def _sample_before_cross(tf, t, now):
+        nonlocal crossing_time_rel, crossing_time_abs, on_sample
+        if tf >= THRESHOLD_C:
+            crossing_time_rel = t
+            crossing_time_abs = now
+            ax.axvline(crossing_time_rel, linestyle='--', linewidth=1.5, color='g')
+            ax.annotate(f"T>{THRESHOLD_C:.0f}°C @ {crossing_time_rel:.2f}s",
+                        xy=(crossing_time_rel, tf),
+                        xytext=(crossing_time_rel + 2, tf),
+                        arrowprops=dict(arrowstyle='->', lw=1.0))
+            fig.canvas.draw_idle()  # bake marker into the background
+            on_sample = _sample_after_cross
+
+    on_sample = _sample_before_cross
+
+    # --- Background OCR process ---
+    sample_q = MQueue(maxsize=64)  # (monotonic ts, T) samples, every one kept
+    ocr_stop = MEvent()
+    ocr = Process(target=ocr_proc, name="OCRProcess",
+                  args=(x, y, w, h, sample_q, ocr_stop), daemon=True)
+    ocr.start()
+    pin_to_core(0)  # after spawning, so the child doesn't inherit core 0
     stop_evt = Event()
 
-    def ocr_worker():
-        """Performs OCR at fixed cadence and stores latest value."""
+    # --- Background CSV writer ---
+    def writer_worker():
+        """Drains the log queue to disk once per second."""
         while not stop_evt.is_set():
-            tstart = perf_counter()
-            tmp = read_temperature_from_roi(x, y, w, h) 
-            if tmp is not None:
-                latest["temp"] = tmp
-                latest["ts"] = time.time()
-            dt = perf_counter() - tstart
-            remain = max(0.0, OCR_PERIOD - dt)
-            stop_evt.wait(remain)
+            stop_evt.wait(1.0)
+            drain_log()
+
+    wthr = Thread(target=writer_worker, name="CSVWriter", daemon=True)
+    wthr.start()
 
-    thr = Thread(target=ocr_worker, name="OCRWorker", daemon=True)
-    thr.start()
+    # --- Background serial writer ---
+    serial_error = [None]  # set by the serial writer if the port fails
+
+    def serial_worker():
+        """Sends only the latest PWM; bursts of edits are coalesced."""
+        last_sent, last_send_t = -1, 0.0
+        while not stop_evt.is_set():
+            pwm_evt.wait(0.05)
+            pwm_evt.clear()
+            p, now = pwm_slot[0], time.monotonic()
+            if p != last_sent or now - last_send_t > KEEPALIVE:
+                try:
+                    ser.write(bytes([p]))
+                except serial.SerialException as e:
+                    # PWM can no longer reach the Arduino: stop the whole run
+                    # instead of logging commands that are never sent
+                    serial_error[0] = e
+                    print(f"\n[ERROR] Serial write failed, stopping: {e}")
+                    stop_evt.set()
+                    return
+                last_sent, last_send_t = p, now
+
+    sthr = Thread(target=serial_worker, name="SerialWriter", daemon=True)
+    sthr.start()
+
+    # --- Background console status line ---
+    status_slot = [(None, pwm_label)]  # latest (temp or None, PWM text); formatted off-loop
+
+    def print_worker():
+        """Writes the status line at PRINT_PERIOD, only when it changed."""
+        last = None
+        while not stop_evt.wait(PRINT_PERIOD):
+            st = status_slot[0]
+            if st == last:
+                continue
+            last = st
+            tf, label = st
+            t_str = f"{tf:6.2f}" if tf is not None else "  --.-"
+            sys.stdout.write(f"\rT={t_str} °C | PWM={label}")
+            sys.stdout.flush()
+
+    pthr = Thread(target=print_worker, name="StatusPrinter", daemon=True)
+    pthr.start()
+
+    # --- Background plot-frame renderer ---
+    # Leading-edge throttle: the first new sample after a quiet period is
+    # rendered immediately, later ones coalesce until PLOT_PERIOD elapses.
+    # The thread only snapshots the ring buffer and computes limits; the
+    # matplotlib artists are touched on this (GUI) thread, since GUI
+    # backends are not thread-safe.
+    ring_lock = Lock()
+    render_evt = Event()
+    frame_slot = [None]  # latest (t_arr, T_arr, ylim) ready to draw
+
+    def render_worker():
+        while not stop_evt.is_set():
+            if not render_evt.wait(PLOT_PERIOD):
+                continue
+            render_evt.clear()
+            with ring_lock:
+                if ring.n < 2:
+                    continue
+                t_arr, T_arr = (a.copy() for a in ring.view())
+            ylim = (float(T_arr.min()) - 2, float(T_arr.max()) + 2)
+            with ring_lock:
+                frame_slot[0] = (t_arr, T_arr, ylim)
+            stop_evt.wait(PLOT_PERIOD)
+
+    rthr = Thread(target=render_worker, name="PlotRenderer", daemon=True)
+    rthr.start()
 
     # --- Timers for throttling ---
-    next_plot = time.time()
-    next_print = time.time()
+    next_plot = next_limits = time.monotonic()
+    next_tick = time.monotonic()
+
+    last_tf = None
 
     try:
-        while plt.fignum_exists(fig.number):
-            now = time.time()
-            t = now - t0
-
-            # Send PWM to Arduino (manual control)
-            ser.write(bytes([pwm]))
-
-            # Get latest OCR reading
-            temp = latest["temp"]
-
-            if temp is not None:
-                tf = outlier.update(temp)
-
-                # Detect threshold crossing
-                if crossing_time_rel is None and tf >= THRESHOLD_C:
-                    crossing_time_rel = t
-                    crossing_time_abs = now
-                    ax.axvline(crossing_time_rel, linestyle='--', linewidth=1.5, color='g')
-                    ax.annotate(f"T>{THRESHOLD_C:.0f}°C @ {crossing_time_rel:.2f}s",
-                                xy=(crossing_time_rel, tf),
-                                xytext=(crossing_time_rel + 2, tf),
-                                arrowprops=dict(arrowstyle='->', lw=1.0))
-
-                # Log to CSV
-                t_el = time.time() - tlog0
-                csv_writer.writerow([
-                    f"{t_el:.4f}", f"{tf:.4f}", "", pwm, ""
-                ])
-                if time.time() - _last_flush >= 1.0:
-                    csv_file.flush()
-                    _last_flush = time.time()
-
-                # Throttled console output
-                if now >= next_print:
-                    print(f"\rT={tf:6.2f} °C | PWM={pwm:3d} ({pwm / 2.55:3.0f}%)", end="")
-                    next_print = now + PRINT_PERIOD
+        while plt.fignum_exists(fig.number) and not stop_evt.is_set():
+            now = time.monotonic()
+
+            # Drain every OCR sample produced since the last iteration
+            batch = []
+            while True:
+                try:
+                    batch.append(sample_q.get_nowait())
+                except Empty:
+                    break
+
+            if batch:
+                ts_arr, temp_arr = np.array(batch, dtype=np.float64).T
+                tf_arr = outlier.update_batch(temp_arr)
+
+                for ts, tf in zip(ts_arr.tolist(), tf_arr.tolist()):
+                    # Detect threshold crossing
+                    on_sample(tf, ts - t0, ts)
+                    # Log to CSV (written by the background writer)
+                    log_q.put_nowait((ts - tlog0, tf, pwm))
+                last_tf = tf
 
                 # Add data for plotting
-                temps.append(tf)
-                t_axis.append(t)
-            else:
-                if now >= next_print:
-                    print(f"\rT=  --.- °C | PWM={pwm:3d} ({pwm / 2.55:3.0f}%)", end="")
-                    next_print = now + PRINT_PERIOD
-
-            # Throttled plot update
-            if now >= next_plot and len(t_axis) > 1:
-                lt.set_data(t_axis, temps)
-                ax.set_xlim(max(0, t_axis[0]), t_axis[-1] + 1)
-                ymin = min(temps) - 2 if temps else 0
-                ymax = max(temps) + 2 if temps else 10
-                ax.set_ylim(ymin, ymax)
-                fig.canvas.draw()
+                with ring_lock:
+                    ring.extend(ts_arr - t0, tf_arr)
+                render_evt.set()
+
+            # Console status (printed by the background printer)
+            status_slot[0] = (last_tf, pwm_label)
+
+            # Draw the latest frame prepared by the renderer (if any)
+            with ring_lock:
+                frame, frame_slot[0] = frame_slot[0], None
+            if frame is not None:
+                t_arr, T_arr, ylim = frame
+                lt.set_data(t_arr, T_arr)
+                redraw = bg is None
+                if now >= next_limits:
+                    xlim = (max(0.0, float(t_arr[0])), float(t_arr[-1]) + 1 + LIMITS_PERIOD)
+                    if xlim != ax.get_xlim() or ylim != ax.get_ylim():
+                        ax.set_xlim(*xlim)
+                        ax.set_ylim(*ylim)
+                        redraw = True
+                    next_limits = now + LIMITS_PERIOD
+                if redraw:
+                    fig.canvas.draw()  # on_draw re-caches the background
+                else:
+                    fig.canvas.restore_region(bg)
+                    ax.draw_artist(lt)
+                    fig.canvas.blit(ax.bbox)
+
+            # Keep the GUI responsive even when no new samples arrive
+            if frame is not None or now >= next_plot:
                 fig.canvas.flush_events()
                 next_plot = now + PLOT_PERIOD
 
-            time.sleep(INTERVAL)
+            # Fixed cadence on the monotonic clock; skip ahead after overruns
+            next_tick = max(next_tick + INTERVAL, time.monotonic())
+            stop_evt.wait(max(0.0, next_tick - time.monotonic()))
 
     except KeyboardInterrupt:
         print("\nInterrupted.")
     finally:
-        # Stop worker and clean up
+        if serial_error[0] is not None:
+            print(f"\nStopped: serial port failed ({serial_error[0]}).")
+        # Stop workers and clean up
+        ocr_stop.set()
+        stop_evt.set()
+        sthr.join(timeout=1.0)  # no PWM write may follow the final 0
         try:
             ser.write(bytes([0]))
             print("\nPWM = 0%")
         except Exception:
             pass
 
-        stop_evt.set()
-        thr.join(timeout=1.0)
+        ocr.join(timeout=1.0)
+        wthr.join()  # no timeout: the final drain below must not race the writer
+        rthr.join(timeout=1.0)
+        pthr.join(timeout=1.0)
         ser.close()
 
         try:
-            csv_file.flush()
-            csv_file.close()
+            drain_log()
+            os.close(csv_fd)
             print(f"Saved CSV: {log_path}")
         except Exception:
             pass
@@ -2,19 +2,25 @@
 Autor: Nicolas Muñoz
 """
 
-import time
+from control_core import pid_step  # primero: fija los límites de hilos OpenMP
 import os
-import csv
+import time
 import serial
+import numpy as np
 import matplotlib.pyplot as plt
-from collections import deque
+from queue import SimpleQueue, Empty
+from threading import Thread, Event
 from read_temp2 import select_roi, read_temperature_from_roi
+from ringbuf import RingBuffer
 
 # ---------------- CONFIG ----------------
 PORT          = "COM3"
 SETPOINT      = 300.0      # °C
 PID_DURATION  = 30.0       #s
-LOOP_DT       = 0.01       #s (periodo de control/plot)
+LOOP_DT       = 0.01       #s (periodo de control)
+PLOT_PERIOD   = 0.10       #s (refresco de la gráfica)
+LIMITS_PERIOD = 1.0        #s (ajuste de ejes = redibujado completo; blit entre medias)
+KEEPALIVE     = 0.5        #s (reenvío del PWM aunque no cambie)
 
 USE_MOUSE_ROI = False
 ROI_X, ROI_Y, ROI_W, ROI_H = 332, -979, 1479, 698
@@ -34,16 +40,14 @@ class PID:
         now = time.time()
         e = self.setpoint - pv
         dt = (now - self.last_time) if self.last_time else 0.0
-        de_dt = (e - self.last_error) / dt if dt > 0 else 0.0
-        self.integral += e * dt
-        u = self.Kp * e + self.Ki * self.integral + self.Kd * de_dt
-        u = max(self.lo, min(self.hi, u))
+        u, self.integral = pid_step(e, self.integral, self.last_error, dt,
+                                    self.Kp, self.Ki, self.Kd,
+                                    self.lo, self.hi)
         self.last_error, self.last_time = e, now
         return int(u)
 
 # ---- CSV logging with auto-numbering ----
 logs_dir = os.path.join(os.path.dirname(__file__), "logs")
-os.makedirs(logs_dir, exist_ok=True)
 
 def get_next_file_number(base_name):
     existing = [f for f in os.listdir(logs_dir)
@@ -58,16 +62,6 @@ def get_next_file_number(base_name):
             pass
     return (max(nums) + 1) if nums else 1
 
-base_name   = f"T{int(SETPOINT)}_{int(PID_DURATION)}s"  # p.ej. T170_30
-file_number = get_next_file_number(base_name)
-log_path    = os.path.join(logs_dir, f"{base_name}_{file_number}.csv")
-
-csv_file   = open(log_path, "w", newline="", encoding="utf-8")
-csv_writer = csv.writer(csv_file)
-csv_writer.writerow(["time_s", "temp_c", "setpoint_c", "pwm", "error_c"])
-tlog0 = time.time()
-_last_flush = time.time()
-
 # ---------------- MAIN ----------------
 def main():
     # ROI
@@ -77,46 +71,103 @@ def main():
     ser = serial.Serial(PORT, 9600, timeout=1)
     time.sleep(0.5)
 
-    # Plot
+    # Plot (blitting: el fondo estático se cachea tras cada redibujado completo)
     plt.ion()
     fig, ax = plt.subplots()
     ax.set_xlabel("Time (s)")
     ax.set_ylabel("Temperature (°C)")
     ax.set_title("Preheat (100%) → PID → Stop")
-    line_temp, = ax.plot([], [], label="Temperature")
-    line_setp, = ax.plot([], [], "r--", label="Setpoint")
+    line_temp, = ax.plot([], [], label="Temperature", animated=True)
+    line_setp = ax.axhline(SETPOINT, color="r", ls="--", label="Setpoint")
     ax.legend()
 
     t0 = time.time()
-    t_buf = deque(maxlen=4000)
-    T_buf = deque(maxlen=4000)
+    ring = RingBuffer(4000)
+    plot_setpoint = [SETPOINT]
 
     def update_plot(t_now, T_now, setpoint):
-        t_buf.append(t_now)
-        T_buf.append(T_now)
-        line_temp.set_data(t_buf, T_buf)
-        line_setp.set_data(t_buf, [setpoint] * len(t_buf))
-        ax.set_xlim(0, max(10, t_now + 1))
-        ymin = min(T_buf) - 5 if T_buf else setpoint - 10
-        ymax = max(T_buf) + 5 if T_buf else setpoint + 10
-        ax.set_ylim(ymin, ymax)
-        fig.canvas.draw()
+        ring.append(t_now, T_now)
+        plot_setpoint[0] = setpoint
+
+    bg = None
+    def on_draw(event):
+        nonlocal bg
+        bg = fig.canvas.copy_from_bbox(ax.bbox)
+        ax.draw_artist(line_temp)
+    fig.canvas.mpl_connect("draw_event", on_draw)
+    fig.canvas.draw()
+    next_plot = next_limits = time.time()
+
+    def redraw():
+        # el lazo solo guarda muestras; se redibuja cada PLOT_PERIOD
+        nonlocal next_plot, next_limits
+        now = time.time()
+        if now >= next_plot and ring.n >= 2:
+            next_plot = now + PLOT_PERIOD
+            t_arr, T_arr = ring.view()
+            line_temp.set_data(t_arr, T_arr)
+            sp = plot_setpoint[0]
+            full = bg is None
+            if sp != line_setp.get_ydata()[0]:
+                line_setp.set_ydata([sp, sp])
+                full = True
+            if now >= next_limits:
+                xlim = (0.0, max(10.0, float(t_arr[-1]) + 1 + LIMITS_PERIOD))
+                ylim = (float(T_arr.min()) - 5, float(T_arr.max()) + 5)
+                if xlim != ax.get_xlim() or ylim != ax.get_ylim():
+                    ax.set_xlim(*xlim); ax.set_ylim(*ylim)
+                    full = True
+                next_limits = now + LIMITS_PERIOD
+            if full:
+                fig.canvas.draw()  # on_draw vuelve a cachear el fondo
+            else:
+                fig.canvas.restore_region(bg)
+                ax.draw_artist(line_temp)
+                fig.canvas.blit(ax.bbox)
         fig.canvas.flush_events()
-        plt.pause(0.001)
+
+    # CSV: se abre aquí, junto al hilo escritor (no al importar el módulo)
+    os.makedirs(logs_dir, exist_ok=True)
+    base_name   = f"T{int(SETPOINT)}_{int(PID_DURATION)}s"  # p.ej. T170_30
+    file_number = get_next_file_number(base_name)
+    log_path    = os.path.join(logs_dir, f"{base_name}_{file_number}.csv")
+
+    # fd crudo: las filas son ASCII, una sola escritura por lote volcado
+    csv_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND
+                     | getattr(os, "O_BINARY", 0), 0o644)
+    os.write(csv_fd, b"time_s,temp_c,setpoint_c,pwm,error_c\n")
+    tlog0 = time.time()
+    log_q = SimpleQueue()  # filas crudas (t_el, temp, setpoint, pwm) para el hilo escritor
+
+    def drain_log():
+        # formatea y escribe todas las filas encoladas de una vez
+        rows = []
+        while True:
+            try:
+                t_el, temp, setpoint, pwm = log_q.get_nowait()
+            except Empty:
+                break
+            if temp is not None:
+                rows.append(f"{t_el:.4f},{temp:.4f},{setpoint:.2f},{pwm},{setpoint - temp:.4f}\n")
+            else:
+                rows.append(f"{t_el:.4f},,{setpoint:.2f},{pwm},\n")
+        buf = "".join(rows).encode("ascii")
+        while buf:  # os.write puede escribir parcialmente
+            buf = buf[os.write(csv_fd, buf):]
+
+    # Hilo escritor: vuelca la cola al CSV cada ~1s
+    stop_evt = Event()
+
+    def writer_worker():
+        while not stop_evt.is_set():
+            stop_evt.wait(1.0)
+            drain_log()
+
+    wthr = Thread(target=writer_worker, name="CSVWriter", daemon=True)
+    wthr.start()
 
     def log_row(temp, setpoint, pwm):
-        global _last_flush
-        t_el = time.time() - tlog0
-        err = (setpoint - temp) if (temp is not None) else ""
-        csv_writer.writerow([f"{t_el:.4f}",
-                             f"{temp:.4f}" if temp is not None else "",
-                             f"{setpoint:.2f}",
-                             int(pwm),
-                             f"{err:.4f}" if temp is not None else ""])
-        # flush cada ~1s
-        if time.time() - _last_flush >= 1.0:
-            csv_file.flush()
-            _last_flush = time.time()
+        log_q.put_nowait((time.time() - tlog0, temp, setpoint, int(pwm)))
 
     try:
         # ---------- PREHEAT ----------
@@ -139,6 +190,7 @@ def main():
                 if T >= SETPOINT:
                     break  # ahora el PID_DURATION empieza aquí
 
+            redraw()
             time.sleep(LOOP_DT)
         """""
         # ---------- PID ----------
@@ -146,6 +198,7 @@ def main():
         pid = PID(Kp=0.24, Ki=0.33, Kd=0.012, setpoint=SETPOINT)
         #pid = PID(Kp=0, Ki=0, Kd=0, setpoint=SETPOINT)
         start_pid = time.time()
+        last_sent, last_send_t = -1, 0.0
 
         while (time.time() - start_pid) < PID_DURATION:
             if not plt.fignum_exists(fig.number):
@@ -156,11 +209,16 @@ def main():
 
             if T is not None:
                 pwm = pid.update(T)
-                ser.write(bytes([pwm]))
+                # solo se envía si cambia (o cada KEEPALIVE s)
+                now = time.time()
+                if pwm != last_sent or now - last_send_t > KEEPALIVE:
+                    ser.write(bytes([pwm]))
+                    last_sent, last_send_t = pwm, now
                 update_plot(t_now, T, SETPOINT)
                 log_row(T, SETPOINT, pwm)
                 print(f"T={T:6.1f} °C | PWM={pwm:3d}", end="\r")
 
+            redraw()
             time.sleep(LOOP_DT)
 
         # ---------- STOP (PWM=0, mantener 2s gráfica) ----------
@@ -182,6 +240,7 @@ def main():
                 update_plot(t_now, T, SETPOINT)
                 log_row(T, SETPOINT, 0)
                 print(f"T={T:6.1f} °C | PWM=  0", end="\r")
+            redraw()
             time.sleep(LOOP_DT)
 
     except KeyboardInterrupt:
@@ -193,13 +252,15 @@ def main():
             ser.close()
         except Exception:
             pass
+        stop_evt.set()
+        wthr.join()  # sin timeout: el último volcado no puede solaparse con el hilo
         try:
-            csv_file.flush()
-            csv_file.close()
+            drain_log()
+            os.close(csv_fd)
             print(f"\n[CSV] Guardado: {log_path}")
         except Exception:
             pass
-        plt.close('all')
+        plt.close(fig)
         print("\n[FIN] PWM=0%, gráfica cerrada, programa terminado.")
 
 if __name__ == "__main__":
@@ -1,13 +1,22 @@
-import time, serial, matplotlib.pyplot as plt, numpy as np, csv, os
-from collections import deque
+from control_core import pid_step  # first: sets the OpenMP thread limits
+import os, sys, time, serial, matplotlib.pyplot as plt, numpy as np
+from threading import Thread, Event
+from queue import Queue, Empty, Full
 from matplotlib.widgets import TextBox
-from read_temp import select_roi, read_temperature_from_roi
+from read_temp import select_roi, read_temperature_from_roi, warmup
+from ringbuf import RingBuffer
 from datetime import datetime
 
 
 INTERVAL  = 0.033   # s
 PORT      = "COM3"
+BAUD      = 9600      # must match Serial.begin() in the Arduino sketch
+READY_BYTE = b"\xa5"  # optional "setup done" byte from the sketch
+RESET_WAIT = 1.0      # s, max wait for the board after opening the port
 SETPOINT0 = 200.0   # ºC 
+PRINT_PERIOD = 0.2  # s, console status line (printer thread)
+KEEPALIVE = 0.5      # s, re-send unchanged PWM at least this often
+LIMITS_PERIOD = 1.0  # s, axis-limit updates (full redraws); blit in between
 
 #x=1443, y=138, w=363, h=286
 
@@ -29,17 +38,16 @@ class PID:
         self._last_time  = None
         self.output_limits = output_limits
         
-    def update(self, pv):
-        now = time.time()
+    def update(self, pv, now=None):
+        """now: perf_counter timestamp of the sample (defaults to the call time)."""
+        if now is None:
+            now = time.perf_counter()
 
         e = self.setpoint - pv
         dt = now - self._last_time if self._last_time else 0.0
-        d = (e - self._last_error)/dt if (self._last_time and dt>0) else 0.0
-        self._integral += e*dt
-
-        out = self.Kp*e + self.Ki*self._integral + self.Kd*d
-
-        lo, hi = self.output_limits; out = max(lo, min(hi, out))
+        lo, hi = self.output_limits
+        out, self._integral = pid_step(e, self._integral, self._last_error, dt,
+                                       self.Kp, self.Ki, self.Kd, lo, hi)
 
         self._last_error, self._last_time = e, now
 
@@ -64,41 +72,90 @@ def main():
         logs_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_T_control_loop_2.csv"
     )
     csv_file = open(log_path, "w", newline="", encoding="utf-8")
-    csv_writer = csv.writer(csv_file)
-    csv_writer.writerow(["time_s", "temp_c", "setpoint_c", "pwm", "error_c"])
+    csv_file.write("time_s,temp_c,setpoint_c,pwm,error_c\n")
+    LOG_FMT = ("%.4f", "%.4f", "%.2f", "%d", "%.4f")
     tlog0 = time.time()
-    _last_flush = time.time()
+
+    # Rows go through a bounded queue; a background thread formats and writes
+    # them once per second so disk I/O never stalls the control loop.
+    log_q = Queue(maxsize=1024)  # raw (t_el, temp, setpoint, pwm, err)
+    stop_evt = Event()
+    def log_row(temp, setpoint, pwm, err):
+        try:
+            log_q.put_nowait((time.time() - tlog0, temp, setpoint, pwm, err))
+        except Full:
+            pass  # drop the row rather than block the loop
+    def drain_log():
+        rows = []
+        while True:
+            try:
+                rows.append(log_q.get_nowait())
+            except Empty:
+                break
+        if rows:  # one (N, 5) block, formatted in a single savetxt call
+            np.savetxt(csv_file, np.array(rows, dtype=np.float64),
+                       fmt=LOG_FMT, delimiter=",")
+    def writer_worker():
+        while not stop_evt.wait(1.0):
+            drain_log(); csv_file.flush()
+    wthr = Thread(target=writer_worker, name="CSVWriter", daemon=True); wthr.start()
+    # --- OCR: model load + first inference before the loop ---
+    warmup()
+
     # --- Arduino ---
-    ser = serial.Serial(PORT, 9600, timeout=1); time.sleep(1)
+    ser = serial.Serial(PORT, BAUD, timeout=0.05, write_timeout=0.05)
+    # Wait for the board: return as soon as the sketch reports ready, or
+    # after RESET_WAIT (boards that reset on open / sketches without it)
+    deadline = time.perf_counter() + RESET_WAIT
+    while time.perf_counter() < deadline:
+        if ser.read(1) == READY_BYTE:
+            break
+    # USB-serial latency timer to 1 ms where pyserial supports it (Linux)
+    try:
+        ser.set_low_latency_mode(True)
+    except (AttributeError, NotImplementedError, ValueError, OSError):
+        pass
+
+    # The Arduino latches the PWM byte: only write on change (+ keepalive)
+    last_sent, last_send_t = -1, 0.0
+    def send_pwm(v):
+        nonlocal last_sent, last_send_t
+        now = time.monotonic()
+        if v != last_sent or now - last_send_t > KEEPALIVE:
+            try:
+                ser.write(bytes([v])); last_sent, last_send_t = v, now
+            except serial.SerialTimeoutException:
+                pass  # port busy: retried on the next call
     def fmt_T(t):
         return f"{t:6.2f} °C" if t is not None else "-- °C"
 
     # --------- PREHEATING HASTA T >= 150°C ----------
     PWM_PREHEAT     = int(1 * 255)   # 20% duty
     PREHEAT_TARGET  = 170.0             # ºC (umbral de lectura de la cámara)
+    PREHEAT_LOG_DT  = 0.2               # s, fila de log como mínimo cada...
+    PREHEAT_LOG_DC  = 0.5               # ºC, ...o cuando T cambie más que esto
 
     print(f"\n[PREHEAT] {PWM_PREHEAT/2.55:.0f}% hasta T ≥ {PREHEAT_TARGET:.0f} °C...")
-    ser.write(bytes([PWM_PREHEAT]))
+    send_pwm(PWM_PREHEAT)
     t_start = time.time()
     hits = 0
+    last_logged_temp, last_log_t = None, 0.0
 
     while True:
         temp = read_temperature_from_roi(x, y, w, h)
-        # Mantén el PWM de preheat mandando el valor periódicamente
-        ser.write(bytes([PWM_PREHEAT]))
+        # Mantén el PWM de preheat (keepalive periódico)
+        send_pwm(PWM_PREHEAT)
 
         if temp is not None:
-            # log preheat sample
-            t_el = time.time() - tlog0
-            err_pre = pid.setpoint - temp
-            csv_writer.writerow([
-                f"{t_el:.4f}", f"{temp:.4f}", f"{pid.setpoint:.2f}", PWM_PREHEAT, f"{err_pre:.4f}"
-            ])
-            if time.time() - _last_flush >= 1.0:
-                csv_file.flush(); _last_flush = time.time()
+            # log preheat sample (skip near-duplicates)
+            now = time.monotonic()
+            if (last_logged_temp is None or abs(temp - last_logged_temp) > PREHEAT_LOG_DC
+                    or now - last_log_t >= PREHEAT_LOG_DT):
+                log_row(temp, pid.setpoint, PWM_PREHEAT, pid.setpoint - temp)
+                last_logged_temp, last_log_t = temp, now
             if temp >= PREHEAT_TARGET:
                 break
-        time.sleep(0.0025)
+        time.sleep(INTERVAL)  # sin control fino durante el preheat
 
     print("\n[PREHEAT] FINISHED → PID")
 
@@ -106,9 +163,9 @@ def main():
     plt.ion(); fig, ax = plt.subplots()
     plt.subplots_adjust(bottom=0.18)
 
-    temps, t_axis = deque(maxlen=200), deque(maxlen=200); t0 = time.time()
-    lt, = ax.plot([], [], 'b', label='Temperature')
-    ls, = ax.plot([], [], 'r--', label='SETPOINT')
+    ring = RingBuffer(200); t0 = time.perf_counter()
+    lt, = ax.plot([], [], 'b', label='Temperature', animated=True)
+    setp_line = ax.axhline(pid.setpoint, color='r', ls='--', label='SETPOINT')
     ax.set_xlabel("Time (s)"); ax.set_ylabel("°C")
     ax.set_title("PID control"); ax.legend()
 
@@ -124,53 +181,123 @@ def main():
         except ValueError:
             print("\n[WARN] No valid number.")
 
-        if t_axis:
-            ls.set_data(t_axis, [pid.setpoint]*len(t_axis))
-            ymin = min(min(temps), pid.setpoint)-2
-            ymax = max(max(temps), pid.setpoint)+2
+        setp_line.set_ydata([pid.setpoint, pid.setpoint])
+        if ring.n:
+            t_arr, T_arr = ring.view()
+            ymin = min(float(T_arr.min()), pid.setpoint)-2
+            ymax = max(float(T_arr.max()), pid.setpoint)+2
             ax.set_ylim(ymin, ymax)
-            fig.canvas.draw_idle()
+        fig.canvas.draw_idle()
     textbox.on_submit(submit)
 
+    # -------- Blitting: cache static background after each full redraw --------
+    bg = None
+    def on_draw(event):
+        nonlocal bg
+        bg = fig.canvas.copy_from_bbox(ax.bbox)
+        ax.draw_artist(lt)
+    fig.canvas.mpl_connect("draw_event", on_draw)
+    fig.canvas.draw()
+    next_limits = time.monotonic()
+
+    # -------- Console status: loop stores the latest values, a thread prints them --------
+    status_slot = [None]   # (temp, err, pwm) or None when the reading failed
+    def print_worker():
+        last, last_p, pct = (), None, ""
+        while not stop_evt.wait(PRINT_PERIOD):
+            st = status_slot[0]
+            if st == last:
+                continue
+            last = st
+            if st is None:
+                sys.stdout.write("\rT=  -- °C")
+            else:
+                temp, err, p = st
+                if p != last_p:  # PWM rarely changes: reuse its % text
+                    pct, last_p = f"{p/2.55:3.0f}", p
+                sys.stdout.write(f"\rT={fmt_T(temp)} | e={err:6.2f} °C | PWM={p:3d} ({pct}%)")
+            sys.stdout.flush()
+    pthr = Thread(target=print_worker, name="StatusPrinter", daemon=True); pthr.start()
+
+    # -------- Capture producer: read(N+1) overlaps PID/plot(N) --------
+    latest = Queue(maxsize=1)   # newest (t_cap, temp) only
+    def capture_worker():
+        while not stop_evt.is_set():
+            t_cap = time.perf_counter()
+            temp = read_temperature_from_roi(x, y, w, h)
+            try:
+                latest.get_nowait()   # drop the stale sample
+            except Empty:
+                pass
+            latest.put_nowait((t_cap, temp))
+            stop_evt.wait(max(0.0, INTERVAL - (time.perf_counter() - t_cap)))
+    cthr = Thread(target=capture_worker, name="Capture", daemon=True); cthr.start()
+
+    next_tick = time.perf_counter() + INTERVAL
     try:
         while plt.fignum_exists(fig.number):
-            t = time.time()-t0
-            temp = read_temperature_from_roi(x, y, w, h)
+            try:
+                t_cap, temp = latest.get_nowait()
+            except Empty:
+                t_cap, temp = None, None   # no new sample this tick
             if temp is not None:
                 tf = outlier.update(temp)
-                pwm, err = pid.update(tf)
-                ser.write(bytes([pwm]))
-                print(f"\rT={fmt_T(temp)} | e={err:6.2f} °C | PWM={pwm:3d} ({pwm/2.55:3.0f}%)", end="")
-                temps.append(tf); t_axis.append(t)
-                ls.set_data(t_axis, [pid.setpoint]*len(t_axis))
+                pwm, err = pid.update(tf, t_cap)   # dt from capture times
+                send_pwm(pwm)
+                status_slot[0] = (temp, err, pwm)
+                ring.append(t_cap - t0, tf)
                 # log control loop sample (filtered temp)
-                t_el = time.time() - tlog0
-                csv_writer.writerow([
-                    f"{t_el:.4f}", f"{tf:.4f}", f"{pid.setpoint:.2f}", pwm, f"{err:.4f}"
-                ])
-                if time.time() - _last_flush >= 1.0:
-                    csv_file.flush(); _last_flush = time.time()
-            else:
-                print("\rT=  -- °C", end="")
+                log_row(tf, pid.setpoint, pwm, err)
+            elif t_cap is not None:
+                status_slot[0] = None
 
 
-            if len(t_axis)>1:
-                lt.set_data(t_axis, temps)
-                ax.set_xlim(max(0, t_axis[0]), t_axis[-1]+1)
-                ymin = min(min(temps), pid.setpoint)-2
-                ymax = max(max(temps), pid.setpoint)+2
-                ax.set_ylim(ymin, ymax)
-                fig.canvas.draw(); fig.canvas.flush_events()
-            time.sleep(INTERVAL)
+            if ring.n>1:
+                t_arr, T_arr = ring.view()
+                lt.set_data(t_arr, T_arr)
+                redraw = bg is None
+                now = time.monotonic()
+                if now >= next_limits:
+                    xlim = (max(0.0, float(t_arr[0])), float(t_arr[-1])+1+LIMITS_PERIOD)
+                    ylim = (min(float(T_arr.min()), pid.setpoint)-2,
+                            max(float(T_arr.max()), pid.setpoint)+2)
+                    if xlim != ax.get_xlim() or ylim != ax.get_ylim():
+                        ax.set_xlim(*xlim); ax.set_ylim(*ylim)
+                        redraw = True
+                    next_limits = now + LIMITS_PERIOD
+                if redraw:
+                    fig.canvas.draw()  # on_draw re-caches the background
+                else:
+                    fig.canvas.restore_region(bg)
+                    ax.draw_artist(lt)
+                    fig.canvas.blit(ax.bbox)
+                fig.canvas.flush_events()
+            # fixed loop period: plain sleep to the deadline (dt comes from the
+            # capture timestamps, so a busy-wait would only steal GIL time)
+            now = time.perf_counter()
+            if now > next_tick + INTERVAL:   # missed a whole slot: drop forward
+                next_tick = now
+            elif next_tick > now:
+                time.sleep(next_tick - now)
+            next_tick += INTERVAL
     except KeyboardInterrupt:
         print("\nInterrumpted.")
     finally:
-        ser.write(bytes([0])); print("\nPWM = 0%"); ser.close()
+        stop_evt.set(); pthr.join(timeout=1.0); cthr.join(timeout=2.0)
         try:
-            csv_file.flush(); csv_file.close()
-            print(f"Saved CSV: {log_path}")
-        except Exception:
-            pass
+            ser.write_timeout = None  # heater-off byte must go out: block until sent
+            ser.write(bytes([0])); ser.flush(); print("\nPWM = 0%")
+        except serial.SerialException as e:
+            print(f"\n[ERROR] Could not send PWM = 0, check the heater: {e}")
+        finally:
+            ser.close()
+            # CSV is always drained and closed, even if the serial shutdown failed
+            wthr.join()  # no timeout: the final drain must not race the writer
+            try:
+                drain_log(); csv_file.flush(); csv_file.close()
+                print(f"Saved CSV: {log_path}")
+            except Exception:
+                pass
         plt.ioff(); plt.show()
 
 if __name__ == "__main__":
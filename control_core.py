@@ -0,0 +1,28 @@
+"""
+control_core.py
+
+Pieces shared by the PID control-loop scripts.
+"""
+
+import os
+# Keep OpenMP-backed libraries (OCR, OpenCV, numba) from spawning one thread
+# per core and competing with the control loop. Import this module before
+# numpy/cv2 so the limits are in place when they load.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+from numba import njit
+
+
+# ---------------- PID ------------------
+# Explicit float64 signature: compiled (or loaded from cache) at import, before
+# any loop starts, and int gains/limits are converted instead of triggering a
+# second specialisation in the middle of a run.
+@njit("UniTuple(float64, 2)(float64, float64, float64, float64, float64, "
+      "float64, float64, float64, float64)", cache=True, nogil=True)
+def pid_step(e, integ, last_e, dt, Kp, Ki, Kd, lo, hi):
+    """One PID step on plain floats -> (clamped output, new integral)."""
+    integ += e*dt
+    d = (e - last_e)/dt if dt > 0 else 0.0
+    u = Kp*e + Ki*integ + Kd*d
+    return max(lo, min(hi, u)), integ
@@ -11,10 +11,12 @@ Date: YYYY-MM-DD
 """
 
 import time
+import threading
 import mss
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
+from numba import njit, prange
 from matplotlib.gridspec import GridSpec
 
 # =====================================================
@@ -39,21 +41,43 @@ TMIN, TMAX = 0.0, 350.0
 
 # Tolerance for considering a pixel pure gray (R≈G≈B)
 GRAY_TOL = 12
+PARALLEL_MIN_PIXELS = 250_000  # ROIs at least this big use the multi-threaded scan
 # =====================================================
 
 
 # -------------------- Screen Capture Helpers --------------------
+_TLS = threading.local()
+
+
+def _get_sct():
+    """Return this thread's mss instance (created once; mss is not thread-safe)."""
+    sct = getattr(_TLS, "sct", None)
+    if sct is None:
+        sct = _TLS.sct = mss.mss()
+    return sct
+
+
+def _release_sct():
+    """Close this thread's mss instance (the next _get_sct() opens a new one)."""
+    sct = getattr(_TLS, "sct", None)
+    if sct is not None:
+        _TLS.sct = None
+        sct.close()
+
+
+def _to_bgr(shot) -> np.ndarray:
+    """View an mss ScreenShot's BGRA bytes as an (h, w, 3) BGR array."""
+    return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)[..., :3]
+
+
 def _mss_region(x: int, y: int, w: int, h: int) -> np.ndarray:
     """Capture an absolute region (x, y, w, h) and return as BGR image."""
-    with mss.mss() as sct:
-        raw = np.array(sct.grab({"left": x, "top": y, "width": w, "height": h}))
-    return raw[..., :3]  # Remove alpha channel
+    return _to_bgr(_get_sct().grab({"left": x, "top": y, "width": w, "height": h}))
 
 
 def _list_monitors():
     """Return a list of detected monitors (mss format)."""
-    with mss.mss() as sct:
-        return sct.monitors  # Index 0 = virtual desktop, 1+ = physical monitors
+    return _get_sct().monitors  # Index 0 = virtual desktop, 1+ = physical monitors
 
 
 def _grab_monitor(monitor_idx: int):
@@ -62,9 +86,7 @@ def _grab_monitor(monitor_idx: int):
     if monitor_idx < 1 or monitor_idx >= len(mons):
         raise ValueError(f"Invalid monitor {monitor_idx}. Available: 1..{len(mons)-1}")
     region = mons[monitor_idx]
-    with mss.mss() as sct:
-        raw = np.array(sct.grab(region))
-    return raw[..., :3], region
+    return _to_bgr(_get_sct().grab(region)), region
 
 
 def _select_roi_on_monitor(monitor_idx: int):
@@ -86,34 +108,134 @@ def _select_roi_on_monitor(monitor_idx: int):
 
 
 # -------------------- Analysis Functions --------------------
-def find_max_pixel_and_coord(bgr_img: np.ndarray):
-    """
-    Convert to grayscale, but keep only pixels where R≈G≈B within GRAY_TOL.
-    Other pixels are set to 0.
-    """
-    b, g, r = cv2.split(bgr_img)
-    maxc = np.maximum(np.maximum(r, g), b)
-    minc = np.minimum(np.minimum(r, g), b)
-    mask = (maxc - minc) <= GRAY_TOL
+def make_frame_buffers(h: int, w: int):
+    """Preallocate the (h, w) uint8 work planes used by find_max_pixel_and_coord."""
+    return tuple(np.empty((h, w), np.uint8) for _ in range(6))
 
-    gray = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2GRAY)
-    gray_masked = np.where(mask, gray, 0).astype(np.uint8)
 
-    _, max_val, _, max_loc = cv2.minMaxLoc(gray_masked)
-    return int(max_val), (int(max_loc[0]), int(max_loc[1])), gray_masked
+def find_max_pixel_and_coord(bgr_img: np.ndarray, bufs=None):
+    """
+    Convert to grayscale and find the brightest pixel, considering only
+    pixels where R≈G≈B within GRAY_TOL. Returns (max_val, (x, y)).
+
+    bufs: optional result of make_frame_buffers() for the ROI size; when
+    given, every intermediate is written in place (no per-frame allocation).
+    """
+    if bufs is None:
+        bufs = make_frame_buffers(*bgr_img.shape[:2])
+    b, g, r, maxc, minc, gray = bufs
+    cv2.split(bgr_img, [b, g, r])
+    cv2.max(r, g, dst=maxc); cv2.max(maxc, b, dst=maxc)
+    cv2.min(r, g, dst=minc); cv2.min(minc, b, dst=minc)
+    cv2.absdiff(maxc, minc, dst=maxc)  # reuse maxc as the channel spread
+    cv2.threshold(maxc, GRAY_TOL, 255, cv2.THRESH_BINARY_INV, dst=minc)  # mask: 255 where gray
+
+    cv2.cvtColor(bgr_img, cv2.COLOR_BGR2GRAY, dst=gray)
+    _, max_val, _, max_loc = cv2.minMaxLoc(gray, mask=minc)
+    if max_loc[0] < 0:  # no gray pixel at all
+        return 0, (0, 0)
+    return int(max_val), (int(max_loc[0]), int(max_loc[1]))
+
+
+@njit(cache=True, nogil=True)
+def _fused_max_gray(bgr, tol):
+    """Single pass: gray-mask test, BGR->gray and first-occurrence argmax.
+
+    Same result as find_max_pixel_and_coord (OpenCV's fixed-point gray
+    weights, minMaxLoc tie-breaking) without any temporary arrays.
+    """
+    h, w = bgr.shape[0], bgr.shape[1]
+    best, bx, by = 0, 0, 0
+    for y in range(h):
+        for x in range(w):
+            b = np.int32(bgr[y, x, 0]); g = np.int32(bgr[y, x, 1]); r = np.int32(bgr[y, x, 2])
+            if max(b, g, r) - min(b, g, r) <= tol:
+                v = (r * 4899 + g * 9617 + b * 1868 + 8192) >> 14
+                if v > best:
+                    best, bx, by = v, x, y
+    return best, bx, by
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def _fused_max_gray_par(bgr, tol):
+    """_fused_max_gray with rows split across threads.
+
+    Each row keeps its own first-occurrence max; the serial reduce then picks
+    the first row holding the overall max, so ties resolve exactly as in the
+    single-threaded scan.
+    """
+    h, w = bgr.shape[0], bgr.shape[1]
+    row_best = np.zeros(h, np.int32)
+    row_x = np.zeros(h, np.int32)
+    for y in prange(h):
+        best, bx = 0, 0
+        for x in range(w):
+            b = np.int32(bgr[y, x, 0]); g = np.int32(bgr[y, x, 1]); r = np.int32(bgr[y, x, 2])
+            if max(b, g, r) - min(b, g, r) <= tol:
+                v = (r * 4899 + g * 9617 + b * 1868 + 8192) >> 14
+                if v > best:
+                    best, bx = v, x
+        row_best[y] = best
+        row_x[y] = bx
+    best, bx, by = 0, 0, 0
+    for y in range(h):
+        if row_best[y] > best:
+            best, bx, by = row_best[y], row_x[y], y
+    return best, bx, by
 
 
 def linmap(value: float, vmin: float, vmax: float, tmin: float, tmax: float) -> float:
     """Map value linearly from range [vmin, vmax] to [tmin, tmax]."""
     if vmax == vmin:
         return float('nan')
-    alpha = np.clip((value - vmin) / (vmax - vmin), 0.0, 1.0)
+    alpha = (value - vmin) / (vmax - vmin)  # plain floats: no NumPy dispatch
+    if alpha < 0.0:
+        alpha = 0.0
+    elif alpha > 1.0:
+        alpha = 1.0
     return tmin + alpha * (tmax - tmin)
 
 
+# Configured mapping folded into one multiply-add for per-frame use
+# (degenerate range VMAX == VMIN -> NaN, like linmap(): readers report None)
+SCALE = (TMAX - TMIN) / (VMAX - VMIN) if VMAX != VMIN else float('nan')
+OFFSET = TMIN - VMIN * SCALE
+
+
+def gray_to_temp(value: float) -> float:
+    """linmap() with the configured [VMIN, VMAX] → [TMIN, TMAX] constants."""
+    if value < VMIN:
+        value = VMIN
+    elif value > VMAX:
+        value = VMAX
+    return OFFSET + SCALE * value
+
+
+@njit(cache=True, nogil=True)
+def _max_gray_temp(bgr, tol, parallel, vmin, vmax, offset, scale):
+    """Gray scan, clamp and multiply-add in one compiled call."""
+    if parallel:
+        best = _fused_max_gray_par(bgr, tol)[0]
+    else:
+        best = _fused_max_gray(bgr, tol)[0]
+    v = min(max(np.float64(best), vmin), vmax)
+    return offset + scale * v
+
+
+def max_gray_temperature(bgr_img: np.ndarray) -> float:
+    """Max gray level of the ROI mapped to °C (gray_to_temp) in one compiled call."""
+    parallel = bgr_img.shape[0] * bgr_img.shape[1] >= PARALLEL_MIN_PIXELS
+    return _max_gray_temp(bgr_img, GRAY_TOL, parallel, VMIN, VMAX, OFFSET, SCALE)
+
+
+# Compile once at import for the layout mss frames have (BGRA sliced to BGR);
+# this also compiles both scan kernels it calls
+_max_gray_temp(np.zeros((1, 1, 4), np.uint8)[..., :3], GRAY_TOL, False, VMIN, VMAX, OFFSET, SCALE)
+
+
 def show_popup(roi_bgr, max_val, max_xy, t_value, vmin, vmax, tmin, tmax):
     """Display ROI image with max pixel marked and grayscale scale bar."""
-    roi_rgb = cv2.cvtColor(roi_bgr, cv2.COLOR_BGR2RGB)
+    roi_rgb = roi_bgr[..., ::-1]  # channel-reversed view, no conversion pass
     mx, my = max_xy
 
     fig = plt.figure(figsize=(8, 4.8), dpi=100)
@@ -152,7 +274,7 @@ def one_shot(roi_abs):
     """Capture ROI once and display max pixel info."""
     x, y, w, h = roi_abs
     roi_bgr = _mss_region(x, y, w, h)
-    max_val, (mx, my), _ = find_max_pixel_and_coord(roi_bgr)
+    max_val, (mx, my) = find_max_pixel_and_coord(roi_bgr)
     T = linmap(max_val, VMIN, VMAX, TMIN, TMAX)
     show_popup(roi_bgr, max_val, (mx, my), T, VMIN, VMAX, TMIN, TMAX)
 
@@ -165,12 +287,13 @@ def loop_mode(roi_abs):
     """Continuously capture ROI and print max pixel info in real-time."""
     period = 1.0 / max(FPS, 0.001)
     x, y, w, h = roi_abs
+    bufs = make_frame_buffers(h, w)  # reused every frame
     try:
         while True:
             t0 = time.time()
             roi_bgr = _mss_region(x, y, w, h)
-            max_val, (mx, my), _ = find_max_pixel_and_coord(roi_bgr)
-            T = linmap(max_val, VMIN, VMAX, TMIN, TMAX)
+            max_val, (mx, my) = find_max_pixel_and_coord(roi_bgr, bufs)
+            T = gray_to_temp(max_val)
             print(f"T={T:.2f}°C  max={max_val}  pos=({mx},{my})   ", end="\r", flush=True)
             sleep_time = period - (time.time() - t0)
             if sleep_time > 0:
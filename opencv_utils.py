@@ -0,0 +1,37 @@
+"""
+opencv_utils.py
+
+Utilidades de imagen compartidas por opencv_img.py y opencv_video.py.
+"""
+
+import cv2
+import numpy as np
+
+
+def ensure_contiguous_bgr(img_bgra, dst=None):
+    # img_bgra viene de mss (BGRA); cvtColor ya devuelve un BGR contiguo:
+    # una sola pasada, escrita en `dst` si se pasa un buffer (h, w, 3) uint8
+    if dst is None or dst.shape[:2] != img_bgra.shape[:2]:
+        dst = np.empty((img_bgra.shape[0], img_bgra.shape[1], 3), dtype=np.uint8)
+    return cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2BGR, dst=dst)
+
+_STRIP_CACHE = {}
+
+def text_strip(text, width, scale, row_h, pad_bottom):
+    # franja (row_h, width) con `text` (contorno negro + relleno blanco) y su
+    # máscara; se rasteriza una sola vez por tamaño y se reutiliza cada frame
+    key = (text, width, scale, row_h, pad_bottom)
+    hit = _STRIP_CACHE.get(key)
+    if hit is None:
+        strip = np.zeros((row_h, width, 3), np.uint8)
+        alpha = np.zeros((row_h, width), np.uint8)
+        org = (10, row_h - pad_bottom)
+        cv2.putText(alpha, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, 255, 3, cv2.LINE_AA)
+        cv2.putText(strip, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, (255,255,255), 2, cv2.LINE_AA)
+        hit = _STRIP_CACHE[key] = (strip, (alpha > 64)[..., None])
+    return hit
+
+def paste_strip(frame, strip, mask):
+    # pega la franja en el borde inferior del frame (solo los píxeles del texto)
+    h = min(strip.shape[0], frame.shape[0])
+    np.copyto(frame[-h:, :, :3], strip[-h:], where=mask[-h:])
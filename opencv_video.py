@@ -1,11 +1,13 @@
 import time
-import csv
 from collections import deque
+from math import hypot
 import numpy as np
 import cv2
 import mss
 import os
+import threading
 from datetime import datetime
+from opencv_utils import ensure_contiguous_bgr, text_strip, paste_strip
 
 # ================== CONFIG ==================
 OUTPUT_CSV = "deformation_log1.csv"
@@ -13,27 +15,107 @@ SMOOTH_WINDOW = 5          # tamaño media móvil para suavizar (frames)
 PIXELS_PER_UNIT = None     # ej.: px/mm si conoces la escala; si no, deja None
 UNIT_NAME = "mm"           # etiqueta de unidad si defines PIXELS_PER_UNIT
 INITIAL_MONITOR = 1        # 1 = monitor principal (mss usa 1-index)
+AUTOSAVE_EVERY = 512       # muestras: se añaden al CSV de la sesión cada N
+CSRT_GRAY_FEATURES = True  # CSRT solo con HOG + gris (sin Color Names): mucho más rápido
+CSRT_TEMPLATE_SIZE = 100   # lado (px) al que CSRT reescala su ventana de búsqueda (def. 200)
+CSRT_PADDING = 2.0         # ventana de búsqueda = padding × tamaño del objetivo (def. 3.0)
 # ============================================
 
 def timestamp():
     return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-def ensure_contiguous_bgr(img_bgra):
-    # img_bgra viene de mss (BGRA)
-    img = img_bgra[:, :, :3]
-    img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-    return np.ascontiguousarray(img)
+def csrt_params():
+    # CSRT convierte internamente una entrada gris a BGR, así que pasarle un
+    # frame gris no ahorra nada; lo que cuesta son los canales de features.
+    p = cv2.TrackerCSRT_Params()
+    # CSRT ya solo procesa una ventana alrededor del objetivo (no el frame
+    # entero); su coste lo fijan el tamaño de esa ventana y la plantilla.
+    p.template_size = float(CSRT_TEMPLATE_SIZE)
+    p.padding = float(CSRT_PADDING)
+    if CSRT_GRAY_FEATURES:
+        p.use_color_names = False
+        p.use_rgb = False
+        p.use_gray = True
+    return p
 
 def get_tracker():
+    # la API nueva es la que admite parámetros; la legacy queda de respaldo
+    if hasattr(cv2, 'TrackerCSRT_Params'):
+        return cv2.TrackerCSRT_create(csrt_params())
     if hasattr(cv2, 'legacy'):
         return cv2.legacy.TrackerCSRT_create()
     if hasattr(cv2, 'TrackerCSRT_create'):
         return cv2.TrackerCSRT_create()
     raise RuntimeError("Tu OpenCV no tiene CSRT. Instala opencv-contrib-python.")
 
-def grab_screen(sct, monitor):
-    img = np.array(sct.grab(monitor))
-    return ensure_contiguous_bgr(img)
+def init_tracker(tracker, frame, roi):
+    # la API legacy devuelve bool; la nueva devuelve None (lanza si falla)
+    ok = tracker.init(frame, roi)
+    return True if ok is None else bool(ok)
+
+def grab_bgra(sct, monitor):
+    # vista directa sobre el buffer BGRA de mss (sin copia ni conversión)
+    shot = sct.grab(monitor)
+    return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+def grab_screen(sct, monitor, out=None):
+    # captura -> BGR en `out` (reutilizado)
+    return ensure_contiguous_bgr(grab_bgra(sct, monitor), out)
+
+class FrameGrabber:
+    """
+    Captura en un hilo propio: mss bloquea esperando al compositor y,
+    mientras, el bucle principal sigue con CSRT y la ventana.
+    Cada latest() entrega el frame BGRA (vista sobre el buffer de mss, sin
+    conversión) y pide el siguiente, que se captura mientras se procesa este;
+    si nadie lo pide (pausa, diálogo de selección) el hilo no captura.
+    """
+    def __init__(self, monitor):
+        self.monitor = dict(monitor)
+        self._lock = threading.Lock()
+        self._new = threading.Event()   # hay un frame listo en _ready
+        self._want = threading.Event()  # el consumidor pide una captura
+        self._want.set()
+        self._stop = threading.Event()
+        self._ready = None  # último frame completo, pendiente de recoger
+        self._thr = threading.Thread(target=self._run, name="FrameGrabber", daemon=True)
+        self._thr.start()
+
+    def set_monitor(self, monitor):
+        with self._lock:
+            self.monitor = dict(monitor)
+            self._ready = None  # descarta el frame del área anterior
+            self._new.clear()
+            self._want.set()
+
+    def _run(self):
+        sct = mss.mss()  # mss no es thread-safe: handle propio en este hilo
+        while not self._stop.is_set():
+            if not self._want.wait(0.1):
+                continue
+            self._want.clear()
+            mon = self.monitor
+            bgra = grab_bgra(sct, mon)
+            with self._lock:
+                if mon is not self.monitor:
+                    continue  # el área cambió durante la captura (set_monitor ya pidió otra)
+                self._ready = bgra
+                self._new.set()
+        sct.close()
+
+    def latest(self, timeout=0.1):
+        # devuelve el frame BGRA más reciente (None si no llega en `timeout`)
+        if not self._new.wait(timeout):
+            return None
+        with self._lock:
+            frame, self._ready = self._ready, None
+            self._new.clear()
+            self._want.set()  # capturar el siguiente mientras se procesa este
+        return frame
+
+    def stop(self):
+        self._stop.set()
+        self._thr.join(timeout=1.0)
 
 def select_roi_window(title, frame):
     roi = cv2.selectROI(title, frame, fromCenter=False, showCrosshair=True)
@@ -69,10 +151,9 @@ def draw_hud(frame, p1, p2, d_px, d0_px, paused, ok1, ok2):
         cv2.putText(frame, t, (10, y0), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255,255,255), 2, cv2.LINE_AA)
         y0 += 26
 
-    cv2.putText(frame, "a: area  r: re-seleccionar puntos  s: guardar CSV  SPACE: pausa  q: salir",
-                (10, frame.shape[0]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,0), 3, cv2.LINE_AA)
-    cv2.putText(frame, "a: area  r: re-seleccionar puntos  s: guardar CSV  SPACE: pausa  q: salir",
-                (10, frame.shape[0]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 2, cv2.LINE_AA)
+    strip, mask = text_strip("a: area  r: re-seleccionar puntos  s: guardar CSV  SPACE: pausa  q: salir",
+                             frame.shape[1], 0.6, 32, 10)
+    paste_strip(frame, strip, mask)
 
 def _compose_filename(base, tag=None):
     name, ext = os.path.splitext(base)
@@ -80,6 +161,33 @@ def _compose_filename(base, tag=None):
         return f"{name}_{tag}{ext}"
     return base
 
+class SampleLog:
+    """Registro (t, d_px, d_unit, eps) en un array NumPy que crece por bloques."""
+    BLOCK = 4096
+
+    def __init__(self):
+        self.data = np.empty((self.BLOCK, 4), dtype=np.float64)
+        self.n = 0
+
+    def append(self, t, d_px, d_unit, eps):
+        if self.n == len(self.data):
+            self.data = np.concatenate((self.data, np.empty((self.BLOCK, 4), dtype=np.float64)))
+        self.data[self.n] = (t, d_px, np.nan if d_unit is None else d_unit, eps)
+        self.n += 1
+
+    def __len__(self):
+        return self.n
+
+    def rows(self):
+        return self.data[:self.n]
+
+def csv_layout():
+    # (cabecera, columnas de log.rows(), formatos); filas: (t, d_px, d_unit o NaN, eps)
+    if PIXELS_PER_UNIT:
+        return (["t_sec", "d_px", f"d_{UNIT_NAME}", "epsilon"], [0, 1, 2, 3],
+                ["%.3f", "%.6f", "%.6f", "%.8f"])
+    return ["t_sec", "d_px", "epsilon"], [0, 1, 3], ["%.3f", "%.6f", "%.8f"]
+
 def save_csv(log, path, autosave=False):
     if not log:
         return None
@@ -90,18 +198,9 @@ def save_csv(log, path, autosave=False):
     elif os.path.exists(path):
         out_path = _compose_filename(path, timestamp())
 
-    with open(out_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        header = ["t_sec", "d_px", "epsilon"]
-        if PIXELS_PER_UNIT:
-            header.insert(2, f"d_{UNIT_NAME}")
-        w.writerow(header)
-        for row in log:
-            # row: (t, d_px, d_unit or None, eps)
-            if PIXELS_PER_UNIT:
-                w.writerow([f"{row[0]:.3f}", f"{row[1]:.6f}", f"{row[2]:.6f}", f"{row[3]:.8f}"])
-            else:
-                w.writerow([f"{row[0]:.3f}", f"{row[1]:.6f}", f"{row[3]:.8f}"])
+    header, cols, fmt = csv_layout()
+    np.savetxt(out_path, log.rows()[:, cols], delimiter=",", header=",".join(header),
+               comments="", fmt=fmt, encoding="utf-8")
     return out_path
 
 def main():
@@ -112,12 +211,28 @@ def main():
     frame = grab_screen(sct, monitor)
     cv2.namedWindow("Live", cv2.WINDOW_NORMAL)
 
+    bgr_buf = None  # BGR reutilizado; solo se convierte si alguien consume el frame
     trackers = None
     d0_px = None
     paused = False
     dist_smooth = deque(maxlen=SMOOTH_WINDOW)
     t0 = time.time()
-    log = []  # (t, d_px, d_unit?, eps)
+    log = SampleLog()  # (t, d_px, d_unit?, eps)
+
+    # CSV de la sesión: cabecera una vez y filas añadidas cada AUTOSAVE_EVERY
+    # muestras, así un cierre inesperado no pierde la sesión entera
+    live_path = OUTPUT_CSV if not os.path.exists(OUTPUT_CSV) else _compose_filename(OUTPUT_CSV, timestamp())
+    live_header, live_cols, live_fmt = csv_layout()
+    live_fh = open(live_path, "w", newline="", encoding="utf-8")
+    live_fh.write(",".join(live_header) + "\n")
+    written = 0
+
+    def flush_log():
+        nonlocal written
+        if len(log) > written:
+            np.savetxt(live_fh, log.rows()[written:, live_cols], fmt=live_fmt, delimiter=",")
+            live_fh.flush()
+            written = len(log)
 
     def select_area():
         nonlocal crop
@@ -142,8 +257,8 @@ def main():
             return
         t1 = get_tracker()
         t2 = get_tracker()
-        ok1 = t1.init(snap, r1)
-        ok2 = t2.init(snap, r2)
+        ok1 = init_tracker(t1, snap, r1)
+        ok2 = init_tracker(t2, snap, r2)
         if not (ok1 and ok2):
             print("No se pudo inicializar el tracker. Reintenta.")
             trackers = None
@@ -153,9 +268,9 @@ def main():
     # Primer paso: pedir área y puntos
     select_area()
     select_points_and_init()
+    grabber = FrameGrabber(crop)
 
     saved_on_loss = False
-    saved_on_exit = False
 
     try:
         while True:
@@ -163,10 +278,13 @@ def main():
             if cv2.getWindowProperty("Live", cv2.WND_PROP_VISIBLE) < 1:
                 break
 
-            if not paused:
-                frame = grab_screen(sct, crop)
+            bgra = None if paused else grabber.latest()
+            if bgra is not None:
+                # sin trackers el frame solo se muestra: imshow acepta BGRA tal cual
+                frame = bgra
 
                 if trackers is not None:
+                    frame = bgr_buf = ensure_contiguous_bgr(bgra, bgr_buf)
                     t1, t2 = trackers
                     ok1, box1 = t1.update(frame)
                     ok2, box2 = t2.update(frame)
@@ -174,9 +292,9 @@ def main():
                     if ok1 and ok2:
                         p1 = center_of(tuple(map(int, box1)))
                         p2 = center_of(tuple(map(int, box2)))
-                        d_px = float(np.hypot(p2[0]-p1[0], p2[1]-p1[1]))
+                        d_px = hypot(p2[0]-p1[0], p2[1]-p1[1])
                         dist_smooth.append(d_px)
-                        d_px_sm = np.mean(dist_smooth) if len(dist_smooth) else d_px
+                        d_px_sm = sum(dist_smooth) / len(dist_smooth)
 
                         if d0_px is None and d_px_sm > 1e-6:
                             d0_px = d_px_sm
@@ -187,9 +305,11 @@ def main():
                         t = time.time() - t0
                         if PIXELS_PER_UNIT:
                             d_unit = d_px_sm / PIXELS_PER_UNIT
-                            log.append((t, d_px_sm, d_unit, eps))
+                            log.append(t, d_px_sm, d_unit, eps)
                         else:
-                            log.append((t, d_px_sm, None, eps))
+                            log.append(t, d_px_sm, None, eps)
+                        if len(log) - written >= AUTOSAVE_EVERY:
+                            flush_log()
 
             cv2.imshow("Live", frame)
             key = cv2.waitKey(1) & 0xFF
@@ -202,6 +322,7 @@ def main():
             elif key == ord('a'):
                 paused = True
                 select_area()
+                grabber.set_monitor(crop)
                 select_points_and_init()
                 paused = False
                 saved_on_loss = False
@@ -223,11 +344,14 @@ def main():
     except Exception as e:
         print(f"[ERROR] {e}")
     finally:
-        # Guardado final garantizado
-        if not saved_on_exit:
-            path = save_csv(log, OUTPUT_CSV, autosave=False)
-            if path:
-                print(f"[FINAL] Guardado final: {path} ({len(log)} muestras)")
+        grabber.stop()
+        # Guardado final garantizado: solo queda la cola sin volcar
+        flush_log()
+        live_fh.close()
+        if written:
+            print(f"[FINAL] Guardado final: {live_path} ({written} muestras)")
+        else:
+            os.remove(live_path)  # sin muestras: no se deja un CSV vacío
         cv2.destroyAllWindows()
 
 if __name__ == "__main__":
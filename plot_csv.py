@@ -1,4 +1,6 @@
-import sys, os, csv
+import sys, os
+import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 
 # ======================
@@ -13,75 +15,103 @@ CONFIG = {
     "MARKER_SIZE": 5,   # tamaño de los marcadores
 }
 
+COLUMNS = ('time_s', 'temp_c', 'setpoint_c', 'pwm', 'error_c')
+
 def read_csv(path):
-    t, temp, sp, pwm, err = [], [], [], [], []
-    with open(path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                t.append(float(row.get('time_s', '')))  # required
-            except Exception:
-                continue
-            temp_val = row.get('temp_c', '')
-            sp_val   = row.get('setpoint_c', '')
-            pwm_val  = row.get('pwm', '')
-            err_val  = row.get('error_c', '')
-
-            temp.append(float(temp_val) if temp_val not in (None, '',) else float('nan'))
-            sp.append(float(sp_val) if sp_val not in (None, '',) else float('nan'))
-            try:
-                pwm.append(float(pwm_val))
-            except Exception:
-                pwm.append(float('nan'))
-            try:
-                err.append(float(err_val))
-            except Exception:
-                err.append(float('nan'))
-    return t, temp, sp, pwm, err
+    # parser C de pandas; celdas vacías o no numéricas -> NaN
+    empty = (np.empty(0),) * len(COLUMNS)
+    try:
+        df = pd.read_csv(path, encoding='utf-8', na_values=[''], keep_default_na=True)
+    except pd.errors.EmptyDataError:  # fichero de 0 bytes (log recién creado)
+        return empty
+    if 'time_s' not in df:
+        return empty
+    cols = {c: (pd.to_numeric(df[c], errors='coerce').to_numpy(dtype='float64')
+                if c in df else np.full(len(df), np.nan))
+            for c in COLUMNS}
+    keep = ~np.isnan(cols['time_s'])  # time_s es obligatorio
+    return tuple(cols[c][keep] for c in COLUMNS)
 
 def _has_any_number(arr):
-    # True si hay algún valor no-NaN
-    return any(x == x for x in arr)
-
-def plot_file(path):
-    t, temp, sp, pwm, err = read_csv(path)
-    if not t:
-        print('No data in CSV')
-        return
-
-    fig, ax1 = plt.subplots()
+    # True si hay algún valor no-NaN (vectorizado, sin bucle Python)
+    return bool(np.isfinite(arr).any())
 
-    ax1.plot(
-        t, temp, 'b-', marker='o',
-        linewidth=CONFIG["LINE_W"], markersize=CONFIG["MARKER_SIZE"],
-        label='Temp (°C)'
-    )
+class LivePlot:
+    """
+    Figura persistente: las líneas se crean una vez y update() solo cambia
+    sus datos (set_data), sin volver a construir la figura ni los estilos.
+    """
+    def __init__(self, title=''):
+        self.fig, self.ax1 = plt.subplots()
+        ax1 = self.ax1
 
-    if _has_any_number(sp):
-        ax1.plot(
-            t, sp, 'r--', marker='x',
+        self.line_temp, = ax1.plot(
+            [], [], 'b-', marker='o',
+            linewidth=CONFIG["LINE_W"], markersize=CONFIG["MARKER_SIZE"],
+            label='Temp (°C)'
+        )
+        self.line_sp, = ax1.plot(
+            [], [], 'r--', marker='x',
             linewidth=CONFIG["LINE_W"], markersize=CONFIG["MARKER_SIZE"],
             label='Setpoint (°C)'
         )
+        self.line_sp.set_visible(False)
+
+        ax1.set_xlabel('Time (s)', fontsize=CONFIG["LABEL_FS"])
+        ax1.set_ylabel('Temperature (°C)', fontsize=CONFIG["LABEL_FS"])
+        ax1.tick_params(axis='both', which='major', labelsize=CONFIG["TICK_FS"])
+        ax1.set_title(title, fontsize=CONFIG["TITLE_FS"])
+        self._legend()
 
-    ax1.set_xlabel('Time (s)', fontsize=CONFIG["LABEL_FS"])
-    ax1.set_ylabel('Temperature (°C)', fontsize=CONFIG["LABEL_FS"])
-    ax1.tick_params(axis='both', which='major', labelsize=CONFIG["TICK_FS"])
-    ax1.legend(loc='upper left', fontsize=CONFIG["LEGEND_FS"])
+        # eje PWM: solo se crea si llega alguna columna PWM con datos
+        self.ax2 = None
+        self.line_pwm = None
 
-    if _has_any_number(pwm):
-        ax2 = ax1.twinx()
-        ax2.plot(
-            t, pwm, 'g:', marker='s',
+    def _legend(self):
+        lines = [l for l in (self.line_temp, self.line_sp) if l.get_visible()]
+        self.ax1.legend(handles=lines, loc='upper left', fontsize=CONFIG["LEGEND_FS"])
+
+    def _add_pwm_axis(self):
+        self.ax2 = self.ax1.twinx()
+        self.line_pwm, = self.ax2.plot(
+            [], [], 'g:', marker='s',
             linewidth=CONFIG["LINE_W"], markersize=CONFIG["MARKER_SIZE"],
             label='PWM (0-255)'
         )
-        ax2.set_ylabel('PWM (bytes)', fontsize=CONFIG["LABEL_FS"])
-        ax2.tick_params(axis='both', which='major', labelsize=CONFIG["TICK_FS"])
-        ax2.set_ylim(0, 255)
-        ax2.legend(loc='upper right', fontsize=CONFIG["LEGEND_FS"])
+        self.ax2.set_ylabel('PWM (bytes)', fontsize=CONFIG["LABEL_FS"])
+        self.ax2.tick_params(axis='both', which='major', labelsize=CONFIG["TICK_FS"])
+        self.ax2.set_ylim(0, 255)
+        self.ax2.legend(loc='upper right', fontsize=CONFIG["LEGEND_FS"])
+
+    def update(self, t, temp, sp, pwm):
+        self.line_temp.set_data(t, temp)
+
+        has_sp = _has_any_number(sp)
+        self.line_sp.set_data(t, sp)
+        if has_sp != self.line_sp.get_visible():
+            self.line_sp.set_visible(has_sp)
+            self._legend()
+
+        if _has_any_number(pwm):
+            if self.ax2 is None:
+                self._add_pwm_axis()
+            self.line_pwm.set_data(t, pwm)
+
+        self.ax1.relim(visible_only=True)
+        self.ax1.autoscale_view()
+        if self.ax2 is not None:
+            self.ax2.relim()
+            self.ax2.autoscale_view(scaley=False)  # PWM fijo en 0-255
+        self.fig.canvas.draw_idle()
+
+def plot_file(path):
+    t, temp, sp, pwm, err = read_csv(path)
+    if t.size == 0:
+        print('No data in CSV')
+        return
 
-    plt.title(os.path.basename(path), fontsize=CONFIG["TITLE_FS"])
+    plot = LivePlot(os.path.basename(path))
+    plot.update(t, temp, sp, pwm)
     plt.tight_layout()
     plt.show()
 
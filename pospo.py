@@ -16,10 +16,15 @@ data_ml = {
 # Conversión mL → MPa
 FACTOR = 0.312
 
-# Procesar datos
+# Procesar datos: todas las medidas en un solo array + índice de grupo
 times  = sorted(data_ml.keys())
-means  = [np.mean(np.array(data_ml[t]) * FACTOR) for t in times]
-stds   = [np.std (np.array(data_ml[t]) * FACTOR, ddof=1) for t in times]
+group  = np.repeat(np.arange(len(times)), [len(data_ml[t]) for t in times])
+vals   = np.concatenate([data_ml[t] for t in times]) * FACTOR
+n      = np.bincount(group)
+means  = np.bincount(group, vals) / n
+dev    = vals - means[group]
+with np.errstate(divide='ignore', invalid='ignore'):  # n=1 -> std NaN (ddof=1)
+    stds = np.sqrt(np.bincount(group, dev * dev) / (n - 1))
 
 # Gráfica
 plt.errorbar(times, means, yerr=stds, fmt='o-', capsize=5, label='σu')
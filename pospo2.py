@@ -15,9 +15,15 @@ data_ml = {
 
 FACTOR = 0.312  # mL → MPa
 
+# todas las medidas en un solo array + índice de grupo
 temps = sorted(data_ml.keys())
-means = [np.mean(np.array(data_ml[t]) * FACTOR) for t in temps]
-stds  = [np.std (np.array(data_ml[t]) * FACTOR, ddof=1) for t in temps]
+group = np.repeat(np.arange(len(temps)), [len(data_ml[t]) for t in temps])
+vals  = np.concatenate([data_ml[t] for t in temps]) * FACTOR
+n     = np.bincount(group)
+means = np.bincount(group, vals) / n
+dev   = vals - means[group]
+with np.errstate(divide='ignore', invalid='ignore'):  # n=1 -> std NaN (ddof=1)
+    stds = np.sqrt(np.bincount(group, dev * dev) / (n - 1))
 
 plt.errorbar(temps, means, yerr=stds, fmt='o-', capsize=5, label='σu')
 plt.xlabel('Temperature (°C)',fontsize=16)
@@ -1,211 +1,292 @@
 # File: read_temperature.py
-# pip install pyautogui pillow easyocr opencv-python numpy
+# pip install easyocr opencv-python numpy mss
 
 import cv2
 import numpy as np
-import pyautogui as pag
 import easyocr
+import hashlib
+import torch
+import mss
 import re
+import threading
 import time
-import tkinter as tk
-from tkinter import messagebox
-from PIL import Image, ImageTk
+from collections import OrderedDict
+from queue import Queue, Empty
 
 # Parámetros OCR
-DIGIT_RE = re.compile(r"(\d+(?:[.,]\d+)?)")
-reader = easyocr.Reader(["en"], gpu=True)
-
-
-class ROISelector:
-    def __init__(self, screenshot_pil):
-        self.screenshot = screenshot_pil
-        self.roi = None
-        self.start_x = None
-        self.start_y = None
-        self.rect_id = None
-
-        # Create main window
-        self.root = tk.Tk()
-        self.root.title("Select ROI - Draw rectangle around the area")
-        self.root.attributes("-topmost", True)
-
-        # Get screen dimensions and resize image if too large
-        screen_width = self.root.winfo_screenwidth()
-        screen_height = self.root.winfo_screenheight()
-
-        img_width, img_height = self.screenshot.size
-        max_width = int(screen_width * 0.9)
-        max_height = int(screen_height * 0.9)
-
-        if img_width > max_width or img_height > max_height:
-            # Calculate scaling factor to fit screen
-            scale_x = max_width / img_width
-            scale_y = max_height / img_height
-            self.scale = min(scale_x, scale_y)
-
-            new_width = int(img_width * self.scale)
-            new_height = int(img_height * self.scale)
-            display_image = self.screenshot.resize(
-                (new_width, new_height), Image.Resampling.LANCZOS
-            )
-        else:
-            self.scale = 1.0
-            display_image = self.screenshot
-
-        self.photo = ImageTk.PhotoImage(display_image)
-
-        # Create canvas
-        self.canvas = tk.Canvas(
-            self.root, width=display_image.width, height=display_image.height
-        )
-        self.canvas.pack()
-
-        # Display image
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
-
-        # Bind mouse events
-        self.canvas.bind("<Button-1>", self.start_selection)
-        self.canvas.bind("<B1-Motion>", self.update_selection)
-        self.canvas.bind("<ButtonRelease-1>", self.end_selection)
-
-        # Add instructions
-        instruction_frame = tk.Frame(self.root)
-        instruction_frame.pack(pady=5)
-
-        tk.Label(
-            instruction_frame,
-            text="Draw a rectangle around the region of interest, then click 'Confirm'",
-            font=("Arial", 10),
-        ).pack()
-
-        button_frame = tk.Frame(self.root)
-        button_frame.pack(pady=5)
-
-        tk.Button(
-            button_frame,
-            text="Confirm Selection",
-            command=self.confirm_selection,
-            bg="green",
-            fg="white",
-            font=("Arial", 10, "bold"),
-        ).pack(side=tk.LEFT, padx=5)
-        tk.Button(
-            button_frame,
-            text="Cancel",
-            command=self.cancel_selection,
-            bg="red",
-            fg="white",
-            font=("Arial", 10, "bold"),
-        ).pack(side=tk.LEFT, padx=5)
-
-        # Center window
-        self.root.update_idletasks()
-        x = (screen_width // 2) - (self.root.winfo_width() // 2)
-        y = (screen_height // 2) - (self.root.winfo_height() // 2)
-        self.root.geometry(f"+{x}+{y}")
-
-    def start_selection(self, event):
-        self.start_x = event.x
-        self.start_y = event.y
-        if self.rect_id:
-            self.canvas.delete(self.rect_id)
-
-    def update_selection(self, event):
-        if self.rect_id:
-            self.canvas.delete(self.rect_id)
-        self.rect_id = self.canvas.create_rectangle(
-            self.start_x, self.start_y, event.x, event.y, outline="red", width=2
-        )
-
-    def end_selection(self, event):
-        if self.start_x is not None and self.start_y is not None:
-            # Calculate ROI coordinates (convert back to original image coordinates)
-            x1 = int(min(self.start_x, event.x) / self.scale)
-            y1 = int(min(self.start_y, event.y) / self.scale)
-            x2 = int(max(self.start_x, event.x) / self.scale)
-            y2 = int(max(self.start_y, event.y) / self.scale)
-
-            w = x2 - x1
-            h = y2 - y1
-
-            if w > 10 and h > 10:  # Minimum size check
-                self.roi = (x1, y1, w, h)
-
-    def confirm_selection(self):
-        if self.roi:
-            self.root.quit()
-        else:
-            messagebox.showwarning("No Selection", "Please draw a rectangle first!")
-
-    def cancel_selection(self):
-        self.roi = None
-        self.root.quit()
-
-    def get_roi(self):
-        self.root.mainloop()
-        self.root.destroy()
-        return self.roi
+DIGIT_RE = re.compile(r"(\d+)(?:[.,](\d+))?")  # parte entera, decimales
+reader = None  # easyocr.Reader, se crea en la primera lectura (o en warmup())
+_reader_lock = threading.Lock()
+# Sin autotune de cuDNN: los recortes cambian de tamaño y cada forma nueva
+# volvería a lanzar el benchmark de kernels a mitad de la medida
+torch.backends.cudnn.benchmark = False
+BBOX_REFRESH = 30  # re-detectar la caja ajustada del texto cada N lecturas
+BBOX_PAD = 4       # margen (px) alrededor de la caja ajustada
+CHANGE_PIXELS = 6  # píxeles binarios que pueden cambiar (antialiasing) sin repetir el OCR
+OCR_TEXT_H = 48    # altura (px) de texto que basta al reconocedor; ROIs HiDPI se reducen
+OCR_CACHE_SIZE = 128  # recortes ya leídos que se recuerdan (LRU), p.ej. valores que alternan
+
+# Captura: un handle mss por hilo (no son thread-safe), reutilizado en cada lectura
+_tls = threading.local()
+
+
+def _get_sct():
+    sct = getattr(_tls, "sct", None)
+    if sct is None:
+        sct = _tls.sct = mss.mss()
+    return sct
 
 
 def select_roi():
     """
-    Permite al usuario dibujar con el ratón la ROI sobre la pantalla usando tkinter.
+    Permite al usuario dibujar con el ratón la ROI sobre la pantalla (cv2.selectROI).
     Devuelve tupla (x, y, w, h).
     """
     print("Taking screenshot for ROI selection...")
-    screen = pag.screenshot()
-
-    # Convert to PIL Image for tkinter
-    screenshot_pil = screen  # pyautogui.screenshot() already returns PIL Image
+    sct = _get_sct()
+    mon = sct.monitors[1]  # monitor principal
+    shot = np.asarray(sct.grab(mon))  # BGRA: imshow/selectROI lo aceptan tal cual
 
     print("Opening ROI selection window...")
-    print(
-        "Instructions: Draw a rectangle around the region of interest, then click 'Confirm'"
-    )
+    print("Instructions: Draw a rectangle around the region of interest, then press ENTER/SPACE (C to cancel)")
 
-    roi_selector = ROISelector(screenshot_pil)
-    roi = roi_selector.get_roi()
+    win = "Select ROI - Draw rectangle around the area"
+    cv2.namedWindow(win, cv2.WINDOW_NORMAL)  # escalable en pantallas grandes
+    x, y, w, h = cv2.selectROI(win, shot, showCrosshair=False, fromCenter=False)
+    cv2.destroyWindow(win)
 
-    if roi is None:
+    if w <= 10 or h <= 10:  # Minimum size check
         print("ROI selection cancelled.")
         raise RuntimeError("ROI selection was cancelled by user")
 
-    x, y, w, h = roi
+    x, y = int(x) + mon["left"], int(y) + mon["top"]  # a coordenadas absolutas del escritorio
+    w, h = int(w), int(h)
     print(f"ROI seleccionada: x={x}, y={y}, w={w}, h={h}")
     return x, y, w, h
 
 
+class RoiState:
+    """Estado de una ROI entre lecturas."""
+    __slots__ = ("region", "bbox", "reads", "last_crop", "last_temp")
+
+    def __init__(self, region):
+        self.region = region       # dict de región para mss
+        self.bbox = None           # (x0, y0, x1, y1) del texto dentro de la ROI
+        self.reads = BBOX_REFRESH  # lecturas desde la última detección de la caja
+        self.last_crop = None      # último recorte pasado al OCR
+        self.last_temp = None      # temperatura leída de ese recorte
+
+
+# Estado por ROI: {(x, y, w, h): RoiState}
+_roi_cache = {}
+
+
+def binarize(bgra):
+    """
+    Gris + umbral de Otsu; deja el texto negro sobre fondo blanco
+    (se asume que los dígitos ocupan menos píxeles que el fondo).
+    """
+    gray = cv2.cvtColor(bgra, cv2.COLOR_BGRA2GRAY)
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    if cv2.countNonZero(bw) < bw.size // 2:
+        bw = cv2.bitwise_not(bw)
+    return bw
+
+
+def tight_bbox(bw):
+    """Caja (x0, y0, x1, y1) que envuelve los píxeles de texto, con margen."""
+    pts = cv2.findNonZero(cv2.bitwise_not(bw))
+    if pts is None:
+        return 0, 0, bw.shape[1], bw.shape[0]
+    bx, by, bw_, bh_ = cv2.boundingRect(pts)
+    return (max(bx - BBOX_PAD, 0), max(by - BBOX_PAD, 0),
+            min(bx + bw_ + BBOX_PAD, bw.shape[1]), min(by + bh_ + BBOX_PAD, bw.shape[0]))
+
+
+def grab_roi(x, y, w, h):
+    """
+    Captura la ROI y la binariza. Devuelve (estado_roi, imagen_binaria);
+    se puede llamar desde otro hilo (cada hilo usa su propio handle mss).
+    """
+    # El dict de región para mss se construye una vez por ROI y se reutiliza
+    entry = _roi_cache.get((x, y, w, h))
+    if entry is None:
+        region = {"left": int(x), "top": int(y), "width": int(w), "height": int(h)}
+        entry = _roi_cache[(x, y, w, h)] = RoiState(region)
+    return entry, binarize(np.asarray(_get_sct().grab(entry.region)))  # mss ya entrega BGRA
+
+
+def _get_reader():
+    global reader
+    if reader is None:
+        with _reader_lock:
+            if reader is None:
+                reader = easyocr.Reader(["en"], gpu=True)
+    return reader
+
+
+@torch.inference_mode()
+def warmup():
+    """
+    Carga el modelo y hace una primera inferencia (reserva de memoria, carga
+    de kernels). Llamarla antes del bucle de medida; si no, la paga la primera
+    lectura.
+    """
+    _get_reader().recognize(np.full((32, 96), 255, np.uint8), allowlist="0123456789.,")
+
+
+def _text_outside(bw, bbox):
+    """True si hay píxeles de texto (negros) de la ROI fuera de la caja `bbox`."""
+    x0, y0, x1, y1 = bbox
+    text_total = bw.size - cv2.countNonZero(bw)
+    text_inside = (y1 - y0) * (x1 - x0) - cv2.countNonZero(bw[y0:y1, x0:x1])
+    return text_total > text_inside
+
+
+def _changed_crop(entry, bw):
+    """
+    Recorta la ROI binaria a la caja del texto. Devuelve None si el display
+    no ha cambiado desde el último OCR (se reutiliza entry.last_temp).
+    """
+    # Recorte a la caja del texto; se recalcula cada BBOX_REFRESH lecturas o en
+    # cuanto aparecen píxeles de texto fuera de la caja (p.ej. 99.9 -> 100.0)
+    if entry.reads >= BBOX_REFRESH or _text_outside(bw, entry.bbox):
+        entry.bbox, entry.reads = tight_bbox(bw), 0
+    entry.reads += 1
+    x0, y0, x1, y1 = entry.bbox
+    crop = np.ascontiguousarray(bw[y0:y1, x0:x1])
+
+    # Texto muy alto (pantallas HiDPI): reducir por un factor entero antes del
+    # OCR; INTER_AREA promedia bloques y el umbral devuelve un recorte binario
+    k = (y1 - y0) // OCR_TEXT_H
+    if k >= 2:
+        small = cv2.resize(crop, ((x1 - x0) // k, (y1 - y0) // k), interpolation=cv2.INTER_AREA)
+        _, crop = cv2.threshold(small, 127, 255, cv2.THRESH_BINARY)
+
+    # Si el display no ha cambiado (recorte binario igual salvo unos pocos
+    # píxeles de borde), no repetir el OCR
+    last = entry.last_crop
+    if (last is not None and last.shape == crop.shape
+            and cv2.countNonZero(cv2.absdiff(crop, last)) <= CHANGE_PIXELS):
+        return None
+    return crop
+
+
+def parse_temperature(text) -> float | None:
+    """Primer número del texto OCR como float (None si no hay dígitos)."""
+    m = DIGIT_RE.search(text)
+    if not m:
+        return None
+    whole, frac = m.group(1), m.group(2)
+    if frac is None:
+        # sin separador: el último dígito es el decimal (el OCR pierde el punto)
+        return int(whole) / 10 if len(whole) >= 2 else float(whole)
+    return int(whole + frac) / 10 ** len(frac)
+
+
+# LRU de resultados OCR: {(forma, hash_recorte): temperatura}
+_ocr_lru = OrderedDict()
+_ocr_lru_lock = threading.Lock()
+
+
+def _lru_key(crop):
+    return crop.shape, hashlib.blake2b(crop, digest_size=16).digest()
+
+
+def _lru_get(key):
+    """Temperatura ya leída para este recorte (KeyError si no está)."""
+    with _ocr_lru_lock:
+        temp = _ocr_lru[key]
+        _ocr_lru.move_to_end(key)
+        return temp
+
+
+def _lru_put(key, temp):
+    with _ocr_lru_lock:
+        _ocr_lru[key] = temp
+        _ocr_lru.move_to_end(key)
+        if len(_ocr_lru) > OCR_CACHE_SIZE:
+            _ocr_lru.popitem(last=False)
+
+
+@torch.inference_mode()
+def ocr_roi(entry, bw) -> float | None:
+    """
+    Aplica OCR a una ROI ya capturada con grab_roi.
+    Devuelve float con la temperatura, o None si no se detecta.
+    """
+    crop = _changed_crop(entry, bw)
+    if crop is None:
+        return entry.last_temp
+
+    # Un recorte ya visto (el display vuelve a un valor anterior) no se relee
+    key = _lru_key(crop)
+    try:
+        temp = _lru_get(key)
+    except KeyError:
+        temp = None
+        # El recorte ya es solo el texto: recognize() pasa directo al reconocedor
+        # (CRNN) sin ejecutar el detector CRAFT sobre la imagen en cada lectura
+        for _, text, _ in _get_reader().recognize(crop, allowlist="0123456789.,"):
+            temp = parse_temperature(text)
+            if temp is not None:
+                break
+        _lru_put(key, temp)
+
+    entry.last_crop, entry.last_temp = crop, temp
+    return temp
+
+
 def read_temperature_from_roi(x, y, w, h) -> float | None:
     """
     Hace captura de pantalla de la ROI y aplica OCR para extraer un número.
     Devuelve float con la temperatura, o None si no se detecta.
     """
-    snap = pag.screenshot(region=(x, y, w, h))
-    arr = cv2.cvtColor(np.array(snap), cv2.COLOR_RGB2BGR)
-    results = reader.readtext(arr, allowlist="0123456789.,")
-    for _, text, _ in results:
-        m = DIGIT_RE.search(text.replace(",", "."))
-        if m:
-            num_str = m.group(1).replace(",", ".")
-            if "." not in num_str and num_str.isdigit() and len(num_str) >= 2:
-                num_str = num_str[:-1] + "." + num_str[-1]
-            return float(num_str)
-
-    return None
+    return ocr_roi(*grab_roi(x, y, w, h))
 
 
 if __name__ == "__main__":
     # 1. Selecciona ROI
     x, y, w, h = select_roi()
+    warmup()
     print("Iniciando lectura de temperatura. Pulsa Ctrl+C para salir.")
 
+    # Productor: captura cada 0.1 s en un hilo aparte, así la captura de la
+    # siguiente ROI se solapa con el OCR de la actual; solo se guarda la última
+    latest = Queue(maxsize=1)
+    stop_evt = threading.Event()
+
+    def capture_worker():
+        period = 0.1
+        next_t = time.perf_counter()
+        while not stop_evt.is_set():
+            roi = grab_roi(x, y, w, h)
+            try:
+                latest.get_nowait()  # descarta la captura que el OCR no llegó a usar
+            except Empty:
+                pass
+            latest.put_nowait(roi)
+            # Calendario absoluto: el retraso de una vuelta no se acumula
+            next_t += period
+            now = time.perf_counter()
+            if next_t < now:
+                next_t = now  # vuelta desbordada: seguir ya, sin ráfaga de recuperación
+            stop_evt.wait(next_t - now)
+
+    threading.Thread(target=capture_worker, name="Capture", daemon=True).start()
+
     try:
         while True:
-            temp = read_temperature_from_roi(x, y, w, h)
+            try:
+                roi = latest.get(timeout=0.5)
+            except Empty:
+                continue
+            temp = ocr_roi(*roi)
             if temp is not None:
                 print(f"\rTemperatura: {temp:.2f} ºC", end="", flush=True)
             else:
                 print("\rTemperatura: --.- ºC", end="", flush=True)
-            time.sleep(0.1)
     except KeyboardInterrupt:
         print("\nLectura interrumpida por el usuario.")
+    finally:
+        stop_evt.set()
@@ -1,16 +1,27 @@
 """
 read_temp2.py
 
-Minimal adapter to use 'grayscale.py' as a library without modifying its code.
+Minimal adapter to use 'grayscale.py' as a library for polling loops; it
+relies on the capture and fused max-gray -> °C helpers grayscale exposes.
 
 Exposes:
     - select_roi(monitor=None) -> (x, y, w, h)
     - read_temperature_from_roi(x, y, w, h) -> float (°C) | None
+    - TempReader: reusable reader that keeps its capture handle open
 """
 
 import math
+import numpy as np
 import grayscale as cap
 
+# ROIs are tiny: keep OpenCV single-threaded so it does not oversubscribe
+# cores shared with the control loop and other workers.
+cap.cv2.setNumThreads(1)
+
+# Failures expected from a screen grab (display gone, region off-screen...);
+# anything else is a bug and should surface instead of reading as None.
+CAPTURE_ERRORS = (OSError, cap.mss.exception.ScreenShotError)
+
 
 def select_roi(monitor: int | None = None):
     """
@@ -28,6 +39,21 @@ def select_roi(monitor: int | None = None):
     return cap._select_roi_on_monitor(mon_idx)
 
 
+def _roi_to_temperature(roi_bgr):
+    """Map the brightest gray pixel of a BGR ROI to °C (None if invalid)."""
+    # Max gray value (filtered for gray pixels) mapped to °C in one compiled pass
+    T = cap.max_gray_temperature(roi_bgr)
+
+    # Validate result: return None if invalid (NaN or infinite)
+    return T if math.isfinite(T) else None
+
+
+def _read_impl(x: int, y: int, w: int, h: int):
+    """read_temperature_from_roi() without error handling."""
+    roi_bgr = cap._mss_region(int(x), int(y), int(w), int(h))
+    return _roi_to_temperature(roi_bgr)
+
+
 def read_temperature_from_roi(x: int, y: int, w: int, h: int):
     """
     Capture a ROI, find the maximum grayscale pixel, and map it to temperature.
@@ -40,21 +66,36 @@ def read_temperature_from_roi(x: int, y: int, w: int, h: int):
         float | None: Temperature in °C, or None if capture/mapping fails.
     """
     try:
-        # Capture ROI as BGR image
-        roi_bgr = cap._mss_region(int(x), int(y), int(w), int(h))
+        return _read_impl(x, y, w, h)
+    except CAPTURE_ERRORS:
+        # Return None when the capture itself fails
+        return None
 
-        # Find maximum grayscale value (filtered for gray pixels)
-        max_val, _, _ = cap.find_max_pixel_and_coord(roi_bgr)
 
-        # Map grayscale value to temperature using config constants
-        T = cap.linmap(max_val, cap.VMIN, cap.VMAX, cap.TMIN, cap.TMAX)
+class TempReader:
+    """
+    Reusable ROI temperature reader for polling loops.
 
-        # Validate result: return None if invalid (NaN or infinite)
-        if T is None or (isinstance(T, float) and (math.isnan(T) or math.isinf(T))):
-            return None
+    Uses the calling thread's shared mss handle (the same one grayscale's
+    helpers use) and builds each region dict once. mss handles are not
+    thread-safe: create the reader in the thread/process that will call read().
+    """
 
-        return float(T)
+    def __init__(self):
+        self.sct = cap._get_sct()  # opened here, outside read()'s try/except
+        self._regions = {}
+
+    def read(self, x: int, y: int, w: int, h: int):
+        """Same contract as read_temperature_from_roi()."""
+        region = self._regions.get((x, y, w, h))
+        if region is None:
+            region = self._regions[(x, y, w, h)] = {
+                "left": int(x), "top": int(y), "width": int(w), "height": int(h)}
+        try:
+            shot = self.sct.grab(region)
+        except CAPTURE_ERRORS:
+            return None
+        return _roi_to_temperature(np.asarray(shot)[..., :3])  # view, no copy
 
-    except Exception:
-        # Return None on any capture or processing error
-        return None
+    def close(self):
+        cap._release_sct()
@@ -0,0 +1,41 @@
+"""
+ringbuf.py
+
+Fixed-size (t, T) plot history shared by the control-loop scripts.
+"""
+
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-size (t, T) history in one preallocated structured array."""
+    dtype = np.dtype([('t', 'f4'), ('T', 'f4')])
+
+    def __init__(self, size=200):
+        self.buf = np.zeros(size, self.dtype)
+        self.t, self.T = self.buf['t'], self.buf['T']  # field views
+        self.size, self.n, self.head = size, 0, 0
+
+    def append(self, t, T):
+        self.buf[self.head] = (t, T)
+        self.head = (self.head + 1) % self.size
+        self.n = min(self.n + 1, self.size)
+
+    def extend(self, t, T):
+        """Append a batch of samples (only the newest `size` are kept)."""
+        t = np.asarray(t)[-self.size:]
+        T = np.asarray(T)[-self.size:]
+        k = t.size
+        idx = (self.head + np.arange(k)) % self.size
+        self.t[idx] = t
+        self.T[idx] = T
+        self.head = (self.head + k) % self.size
+        self.n = min(self.n + k, self.size)
+
+    def view(self):
+        """Return (t, T) arrays in chronological order."""
+        if self.n < self.size:
+            return self.t[:self.n], self.T[:self.n]
+        h = self.head
+        return (np.concatenate((self.t[h:], self.t[:h])),
+                np.concatenate((self.T[h:], self.T[:h])))